@@ -0,0 +1,158 @@
+"""
+Flask API client for the dashboard.
+
+One keep-alive aiohttp session lives on a background event loop and is shared by
+every Dash callback; the sync wrappers below submit coroutines to that loop.
+"""
+
+import asyncio
+import atexit
+import threading
+
+import aiohttp
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Flask backend used by the server-side callbacks
+API_BASE_URL = 'http://127.0.0.1:5000'
+
+# Shared retry policy (same semantics as urllib3 Retry): only connection errors, timeouts
+# and gateway statuses are retried, with exponential backoff starting at RETRY_BACKOFF_SEC
+RETRY_ATTEMPTS = 2
+RETRY_BACKOFF_SEC = 0.3
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+# Prefer MessagePack for /history when available; the API falls back to JSON otherwise
+HISTORY_ACCEPT = 'application/msgpack, application/json;q=0.5' if msgpack else 'application/json'
+
+
+# Background event loop owning one keep-alive aiohttp session shared by all callbacks
+_HTTP_LOOP = asyncio.new_event_loop()
+threading.Thread(target=_HTTP_LOOP.run_forever, name='http-loop', daemon=True).start()
+
+
+async def _create_session():
+    # Every callback talks to the same Flask host, so the per-host cap is the effective pool size
+    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=32, limit_per_host=16,
+                                                                keepalive_timeout=60))
+
+
+def run(coro):
+    """Run a coroutine on the background HTTP loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _HTTP_LOOP).result()
+
+
+SESSION = run(_create_session())
+atexit.register(lambda: run(SESSION.close()))
+
+
+class _RetryableStatus(Exception):
+    """Raised by a request for a status in RETRY_STATUSES."""
+
+
+async def _with_retry(request):
+    """Await request(), retrying transient failures; returns None when all attempts fail.
+
+    Other HTTP statuses (e.g. 404) are returned as-is by request() and not retried;
+    anything that is not a request/decoding error propagates to the caller.
+    """
+    for attempt in range(RETRY_ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(RETRY_BACKOFF_SEC * 2 ** (attempt - 1))
+        try:
+            return await request()
+        except (_RetryableStatus, aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            continue
+        except (aiohttp.ClientError, ValueError):
+            # other client errors and undecodable bodies (JSON/MessagePack both raise ValueError)
+            return None
+    return None
+
+
+async def _decode(resp):
+    """Decode a JSON or MessagePack response body."""
+    if resp.content_type == 'application/msgpack':
+        return msgpack.unpackb(await resp.read(), raw=False)
+    return await resp.json()
+
+
+async def fetch_price_async(symbol: str):
+    async def request():
+        async with SESSION.get(f'{API_BASE_URL}/price', params={'symbol': symbol},
+                               timeout=aiohttp.ClientTimeout(total=2)) as resp:
+            if resp.status in RETRY_STATUSES:
+                raise _RetryableStatus(resp.status)
+            if resp.status == 200:
+                return await resp.json()
+        return None
+
+    return await _with_retry(request)
+
+
+def _params(symbol, limit, interval):
+    params = {'symbol': symbol, 'limit': limit}
+    if interval:
+        params['interval'] = interval
+    return params
+
+
+async def fetch_history_async(symbol: str, limit: int = 500, interval: str = None):
+    async def request():
+        async with SESSION.get(f'{API_BASE_URL}/history', params=_params(symbol, limit, interval),
+                               headers={'Accept': HISTORY_ACCEPT},
+                               timeout=aiohttp.ClientTimeout(total=5)) as resp:
+            if resp.status in RETRY_STATUSES:
+                raise _RetryableStatus(resp.status)
+            if resp.status == 200:
+                j = await _decode(resp)
+                return j.get('data', [])
+        return None
+
+    return await _with_retry(request)
+
+
+async def fetch_snapshot_async(symbol: str, limit: int = 500, interval: str = None):
+    """History + latest price in one round-trip via /snapshot.
+
+    With interval (e.g. '5m') the API returns one close per candle; the result's
+    'interval' is None when it sent raw ticks instead (older API), so the caller
+    can resample locally. Falls back to concurrent /history and /price calls when
+    the API predates /snapshot (404).
+    """
+    async def request():
+        async with SESSION.get(f'{API_BASE_URL}/snapshot', params=_params(symbol, limit, interval),
+                               headers={'Accept': HISTORY_ACCEPT},
+                               timeout=aiohttp.ClientTimeout(total=5)) as resp:
+            if resp.status in RETRY_STATUSES:
+                raise _RetryableStatus(resp.status)
+            if resp.status == 404:
+                return False
+            if resp.status == 200:
+                return await _decode(resp)
+        return None
+
+    j = await _with_retry(request)
+    if j is False:
+        history, latest = await asyncio.gather(fetch_history_async(symbol, limit), fetch_price_async(symbol))
+        return {'history': history, 'latest': latest, 'interval': None}
+    if j is None:
+        return {'history': None, 'latest': None, 'interval': None}
+    return {'history': j.get('history', []), 'latest': j.get('latest'), 'interval': j.get('interval')}
+
+
+def fetch_price(symbol: str):
+    """Call Flask API to get latest price for symbol. Returns dict or None."""
+    return run(fetch_price_async(symbol))
+
+
+def fetch_history(symbol: str, limit: int = 500, interval: str = None):
+    """Call Flask API /history to get recent points. Returns list of dicts or None."""
+    return run(fetch_history_async(symbol, limit, interval))
+
+
+def fetch_snapshot(symbol: str, limit: int = 500, interval: str = None):
+    """Return {'history': list or None, 'latest': dict or None, 'interval': str or None} for symbol."""
+    return run(fetch_snapshot_async(symbol, limit, interval))
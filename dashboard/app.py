@@ -1,29 +1,58 @@
 ﻿import dash
-from dash import dcc, html, Output, Input, State, callback
-import requests
+import flask
+from dash import dcc, html, Output, Input, State, Patch, ClientsideFunction, callback
+from dash.exceptions import PreventUpdate
+from dash_extensions import EventSource
+import threading
 import datetime
-import plotly.graph_objs as go
+import numpy as np
+import pandas as pd
+import plotly.io as pio
 import json
 import os
-from dotenv import load_dotenv
-from openai import OpenAI
+import time
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import cache, lru_cache
+from string import Template
 import sys
+from urllib.parse import urlsplit
+
+from api_client import fetch_snapshot
 
 # import helper for usage control and risk engine
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
 try:
-    from ai_usage import can_call, record_call
-    from risk_engine import RiskEngine
+    from ai_usage import can_call, try_acquire
+    from risk_engine import RiskEngine, warm_up as warm_up_risk_engine
 except Exception:
     can_call = None
-    record_call = None
+    try_acquire = None
     RiskEngine = None
+    warm_up_risk_engine = None
+
+# The shared summary cache is optional: if it cannot load, summaries just skip the L2 lookup
+try:
+    import ai_cache
+except Exception:
+    ai_cache = None
 
-# Load environment variables from .env file
+# Load environment variables from .env file (python-dotenv only imported when there is one)
 env_path = os.path.join(os.path.dirname(__file__), "..", ".env")
-load_dotenv(env_path)
+if os.path.exists(env_path):
+    from dotenv import load_dotenv
+    load_dotenv(env_path)
+
+# Dash serializes callback responses via plotly's JSON encoder; use the orjson engine when installed
+try:
+    import orjson  # noqa: F401
+    pio.json.config.default_engine = 'orjson'
+except ImportError:
+    pass
 
 app = dash.Dash(__name__)
+server = app.server  # WSGI entry point for gunicorn (see gunicorn.conf.py)
 
 # Add custom CSS for animations
 app.index_string = '''
@@ -61,12 +90,20 @@ app.index_string = '''
 </html>
 '''
 
-# Initialize DeepSeek client (compatible with OpenAI SDK)
+# DeepSeek client (compatible with OpenAI SDK)
 DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
-client = OpenAI(
-    api_key=DEEPSEEK_API_KEY,
-    base_url="https://api.deepseek.com/v1"
-) if DEEPSEEK_API_KEY else None
+
+
+@cache
+def _get_client():
+    """Build the DeepSeek client on first use; the openai SDK is only imported then."""
+    if not DEEPSEEK_API_KEY:
+        return None
+    from openai import OpenAI
+    return OpenAI(
+        api_key=DEEPSEEK_API_KEY,
+        base_url="https://api.deepseek.com/v1"
+    )
 
 # AI usage controls (environment-configurable)
 try:
@@ -78,8 +115,54 @@ try:
 except Exception:
     SUMMARY_COOLDOWN_SEC = 300
 
+# Flask SSE endpoint pushing new prices (opened by the browser, not the Dash server).
+# Unset: the API port on the host the page was loaded from, so LAN devices reach the API too
+PRICE_STREAM_URL = os.getenv('PRICE_STREAM_URL', '')
+PRICE_STREAM_PORT = os.getenv('FLASK_PORT', '5000')
+
+
+def _price_stream_url():
+    """SSE URL for the browser loading the page: PRICE_STREAM_URL, else http://<page host>:FLASK_PORT/stream."""
+    if PRICE_STREAM_URL:
+        return PRICE_STREAM_URL
+    if not flask.has_request_context():
+        # layout validation at startup, outside any page load
+        return f'http://127.0.0.1:{PRICE_STREAM_PORT}/stream'
+    hostname = urlsplit(flask.request.host_url).hostname
+    if ':' in hostname:  # IPv6 literal
+        hostname = f'[{hostname}]'
+    return f'http://{hostname}:{PRICE_STREAM_PORT}/stream'
+
+# Price figure built once: trace styles, hover templates and layout (with the resolved
+# plotly_white template). The clientside graph callback only fills in x/y, names and title.
+PRICE_FIGURE_SKELETON = {
+    'data': [
+        # Historical price line (smooth, no noise)
+        {'type': 'scatter', 'mode': 'lines',
+         'line': {'color': '#1f77b4', 'width': 2}, 'hovertemplate': '%{y:.6f}<extra></extra>'},
+        # MA7 / MA30 (precomputed by load_data)
+        {'type': 'scatter', 'mode': 'lines', 'name': 'MA7',
+         'line': {'color': '#ff7f0e', 'width': 1.5, 'dash': 'dash'}, 'hovertemplate': 'MA7: %{y:.6f}<extra></extra>'},
+        {'type': 'scatter', 'mode': 'lines', 'name': 'MA30',
+         'line': {'color': '#d62728', 'width': 1.5, 'dash': 'dot'}, 'hovertemplate': 'MA30: %{y:.6f}<extra></extra>'},
+        # Latest real-time point (highlighted)
+        {'type': 'scatter', 'mode': 'markers+text', 'name': 'Latest Quote',
+         'marker': {'color': '#2ca02c', 'size': 12, 'symbol': 'star'},
+         'textposition': 'top center', 'textfont': {'size': 10, 'color': '#2ca02c', 'family': 'Arial Black'},
+         'hovertemplate': 'Latest: %{y:.6f}<extra></extra>'},
+    ],
+    'layout': {
+        'xaxis': {'title': {'text': '时间'}},
+        'yaxis': {'title': {'text': '价格'}},
+        'hovermode': 'x unified',
+        'template': pio.templates['plotly_white'].to_plotly_json(),
+        'showlegend': True,
+        'legend': {'orientation': 'h', 'yanchor': 'bottom', 'y': 1.02, 'xanchor': 'right', 'x': 1},
+    },
+}
+
 # UI: symbol dropdown, graph, status, AI summary
-app.layout = html.Div([
+_LAYOUT_CHILDREN = [
     html.H1("Financial Dashboard"),
     
     html.Div([
@@ -97,8 +180,17 @@ app.layout = html.Div([
 
     dcc.Graph(id='price-graph', config={'displayModeBar': False}),
 
-    # store holds list of {ts: ..., price: ...}
-    dcc.Store(id='price-store', data=[]),
+    # static figure skeleton for the clientside graph callback
+    dcc.Store(id='figure-skeleton', data=PRICE_FIGURE_SKELETON),
+
+    # store holds {historical: {ts: [...], price: [...]}, latest, ma7, ma30}
+    dcc.Store(id='price-store', data=None),
+
+    # bumped on every history load; server-side callbacks read the PriceRing instead of the payload
+    dcc.Store(id='price-version', data=0),
+
+    # what the browser's price-store currently holds: {symbol, last_ts, n}; lets refreshes send a Patch
+    dcc.Store(id='price-cursor', data=None),
 
     # store for AI summary
     dcc.Store(id='summary-store', data=''),
@@ -106,8 +198,11 @@ app.layout = html.Div([
     # store for risk data
     dcc.Store(id='risk-store', data={}),
 
-    # Auto-refresh every 5 seconds
-    dcc.Interval(id='interval', interval=5*1000, n_intervals=0),
+    # K-line history refresh (candles close every 5 minutes, live ticks come via SSE)
+    dcc.Interval(id='interval', interval=60*1000, n_intervals=0),
+
+    # Polls a background AI summary job; only enabled while one is pending
+    dcc.Interval(id='ai-poll', interval=1000, n_intervals=0, disabled=True),
 
     # Risk Alert Banner (dynamic)
     html.Div(id='risk-alert-banner', style={'marginTop': '12px'}),
@@ -168,38 +263,19 @@ app.layout = html.Div([
         html.H3("🛡️ Risk Monitor", style={'marginTop': '24px', 'color': '#d32f2f'}),
         html.Div(id='risk-panel', style={'marginTop': '10px'})
     ], style={'marginTop': '20px'})
-])
+]
 
 
-def fetch_price(symbol: str):
-    """Call Flask API to get latest price for symbol. Returns dict or None."""
-    attempts = 2
-    backoff = 0.5
-    for i in range(attempts):
-        try:
-            resp = requests.get(f'http://127.0.0.1:5000/price', params={'symbol': symbol}, timeout=2.0)
-            if resp.status_code == 200:
-                return resp.json()
-        except Exception:
-            pass
-        try:
-            import time
-            time.sleep(backoff * (i + 1))
-        except Exception:
-            pass
-    return None
+def serve_layout():
+    # Built per page load so the SSE URL uses the host this browser reached the dashboard on
+    return html.Div([
+        # Real-time prices pushed by the Flask API over a persistent SSE connection
+        EventSource(id='price-sse', url=_price_stream_url()),
+        *_LAYOUT_CHILDREN
+    ])
 
 
-def fetch_history(symbol: str, limit: int = 500):
-    """Call Flask API /history to get recent points. Returns list of dicts or None."""
-    try:
-        resp = requests.get(f'http://127.0.0.1:5000/history', params={'symbol': symbol, 'limit': limit}, timeout=5.0)
-        if resp.status_code == 200:
-            j = resp.json()
-            return j.get('data', [])
-    except Exception:
-        return None
-    return None
+app.layout = serve_layout
 
 
 def resample_to_low_frequency(data: list, interval_minutes: int = 5):
@@ -221,70 +297,21 @@ def resample_to_low_frequency(data: list, interval_minutes: int = 5):
     if not data or len(data) < 2:
         return data
     
-    from datetime import datetime, timedelta
-    
     try:
-        # Step 1: Parse and sort all data points by timestamp
-        time_price_pairs = []
-        for d in data:
-            ts_str = d['timestamp']
-            if 'Z' in ts_str:
-                ts_str = ts_str.replace('Z', '+00:00')
-            dt = datetime.fromisoformat(ts_str)
-            time_price_pairs.append((dt, float(d['price'])))
-        
-        time_price_pairs.sort(key=lambda x: x[0])
-        
-        if not time_price_pairs:
-            return data
+        # Step 1: Parse all timestamps in one vectorized pass and sort chronologically
+        df = pd.DataFrame(data, columns=['timestamp', 'price'])
+        ts = pd.to_datetime(df['timestamp'], utc=True, format='ISO8601')
+        order = np.argsort(ts.to_numpy(), kind='stable')
+        df, ts = df.iloc[order], ts.iloc[order]
         
         # Step 2: Align to K-line intervals (floor to nearest interval)
-        first_dt = time_price_pairs[0][0]
-        interval_delta = timedelta(minutes=interval_minutes)
-        
-        # Floor the first timestamp to interval boundary
         # Example: 14:32:15 with 5-min interval -> 14:30:00
-        minutes_offset = first_dt.minute % interval_minutes
-        seconds_offset = first_dt.second
-        microseconds_offset = first_dt.microsecond
-        
-        bucket_start = first_dt - timedelta(
-            minutes=minutes_offset,
-            seconds=seconds_offset,
-            microseconds=microseconds_offset
-        )
-        
-        # Step 3: Group data into K-line buckets and extract close price
-        klines = []
-        current_bucket_start = bucket_start
-        current_bucket_data = []
+        bucket = ts.dt.floor(f'{interval_minutes}min')
         
-        for dt, price in time_price_pairs:
-            # Calculate which bucket this data point belongs to
-            while dt >= current_bucket_start + interval_delta:
-                # Close current bucket if it has data
-                if current_bucket_data:
-                    # Take the LAST price in this interval as close price
-                    close_time, close_price = current_bucket_data[-1]
-                    klines.append({
-                        'timestamp': close_time.isoformat(),
-                        'price': close_price
-                    })
-                
-                # Move to next bucket
-                current_bucket_start += interval_delta
-                current_bucket_data = []
-            
-            # Add data point to current bucket
-            current_bucket_data.append((dt, price))
-        
-        # Don't forget to close the last bucket
-        if current_bucket_data:
-            close_time, close_price = current_bucket_data[-1]
-            klines.append({
-                'timestamp': close_time.isoformat(),
-                'price': close_price
-            })
+        # Step 3: Take the LAST point in each interval as the close (keeps its own timestamp)
+        closes = df[~bucket.duplicated(keep='last').to_numpy()]
+        klines = [{'timestamp': t, 'price': p}
+                  for t, p in zip(closes['timestamp'].tolist(), closes['price'].astype('float64').tolist())]
         
         return klines if klines else data
     
@@ -293,118 +320,292 @@ def resample_to_low_frequency(data: list, interval_minutes: int = 5):
         return data
 
 
+def _running_mean(a, window):
+    """Running-sum rolling mean (loop kernel, compiled with Numba when available)."""
+    out = np.empty(a.shape[0] - window + 1)
+    s = 0.0
+    for i in range(window):
+        s += a[i]
+    out[0] = s / window
+    for i in range(window, a.shape[0]):
+        s += a[i] - a[i - window]
+        out[i - window + 1] = s / window
+    return out
+
+
+def _cumsum_mean(a, window):
+    cs = np.cumsum(a)
+    return (cs[window - 1:] - np.concatenate(([0.0], cs[:-window]))) / window
+
+
+@cache
+def _rolling_mean():
+    """Rolling mean kernel: Numba-compiled running sum when available, NumPy otherwise.
+
+    numba is imported on first use so it stays off the dashboard's startup path.
+    """
+    try:
+        from numba import njit
+    except ImportError:
+        return _cumsum_mean
+    return njit(cache=True, fastmath=True, nogil=True)(_running_mean)
+
+
 def calculate_ma(prices, window):
-    """Calculate simple moving average."""
+    """Calculate simple moving average (running sum, O(n))."""
     if len(prices) < window:
         return [None] * len(prices)
-    ma = [None] * (window - 1)
-    for i in range(window - 1, len(prices)):
-        ma.append(sum(prices[i - window + 1:i + 1]) / window)
-    return ma
+    ma = _rolling_mean()(np.asarray(prices, dtype=np.float64), window)
+    # None padding only at the serialization boundary
+    return [None] * (window - 1) + ma.tolist()
 
 
-def get_7day_data(data):
-    """Extract 7-day data from price store. Returns list of dicts or empty list."""
-    if not data:
-        return []
-    
-    # Get the last 7 days worth of data
-    # Assuming ~144 data points per day (86400 seconds / 600 seconds per point if polling every 10 min)
-    # But with 5-second intervals, it's much denser. Let's use a time-based approach instead.
-    now = datetime.datetime.utcnow()
-    seven_days_ago = now - datetime.timedelta(days=7)
-    
-    result = []
-    for d in data:
-        try:
-            ts = datetime.datetime.fromisoformat(d['ts'].replace('Z', '+00:00'))
-            if ts >= seven_days_ago:
-                result.append(d)
-        except Exception:
-            pass
-    
-    return result
+MA_WINDOWS = (7, 30)
+MAX_DISPLAY_POINTS = 300
+CANDLE_INTERVAL = '5m'  # aggregated by the API (/snapshot?interval=5m)
+
+
+# Switching symbols rebuilds the PriceRing from the same few hundred candle timestamps,
+# so parsed values are memoized (3 symbols x 300 candles fit many times over)
+@lru_cache(maxsize=4096)
+def _parse_ts(ts_str):
+    """Parse an ISO timestamp into a naive-UTC numpy datetime64[ms]."""
+    dt = datetime.datetime.fromisoformat(ts_str.replace('Z', '+00:00'))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return np.datetime64(dt, 'ms')
+
+
+class PriceRing:
+    """Fixed-capacity ring buffer of parallel timestamp/price arrays."""
+
+    def __init__(self, capacity=MAX_DISPLAY_POINTS):
+        self.ts = np.empty(capacity, dtype='datetime64[ms]')
+        self.px = np.empty(capacity, dtype=np.float64)
+        self.head = 0  # next write position
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        """Price at logical index i (negative indexes count from the newest)."""
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError(i)
+        return float(self.px[(self.head - self.n + i) % len(self.px)])
+
+    def append(self, ts, price):
+        self.ts[self.head] = ts
+        self.px[self.head] = price
+        self.head = (self.head + 1) % len(self.px)
+        self.n = min(self.n + 1, len(self.px))
 
+    def pop(self):
+        self.head = (self.head - 1) % len(self.px)
+        self.n -= 1
+        return float(self.px[self.head])
 
-def generate_ai_summary(symbol: str, data: list) -> str:
+    def arrays(self):
+        """Return (timestamps, prices) in chronological order."""
+        idx = (self.head - self.n + np.arange(self.n)) % len(self.px)
+        return self.ts[idx], self.px[idx]
+
+
+# Per-symbol server-side history: candles live in a PriceRing (shared by the
+# risk/AI callbacks) and MA7/MA30 are maintained incrementally, so a history
+# refresh that only appends candles (or moves the still-open last candle)
+# costs O(1) per candle.
+MA_STATE = {}
+_MA_LOCK = threading.Lock()
+
+
+def _reset_ma_state(symbol, ts, prices):
+    ring = PriceRing()
+    for t, p in zip(ts, prices):
+        ring.append(_parse_ts(t), p)
+    state = {
+        'ts': deque(ts, maxlen=MAX_DISPLAY_POINTS),
+        'ring': ring,
+        'sums': {w: float(sum(prices[-w:])) for w in MA_WINDOWS},
+        'ma': {w: deque(calculate_ma(prices, w), maxlen=MAX_DISPLAY_POINTS) for w in MA_WINDOWS},
+    }
+    MA_STATE[symbol] = state
+    return state
+
+
+def _append_ma_point(state, ts, price):
+    ring = state['ring']
+    n = len(ring)
+    for w in MA_WINDOWS:
+        # add the new price, drop the one leaving the window
+        state['sums'][w] += price - (ring[n - w] if n >= w else 0.0)
+        state['ma'][w].append(state['sums'][w] / w if n + 1 >= w else None)
+    state['ts'].append(ts)
+    ring.append(_parse_ts(ts), price)
+
+
+def _pop_ma_point(state):
+    ring = state['ring']
+    price = ring.pop()
+    state['ts'].pop()
+    n = len(ring)
+    for w in MA_WINDOWS:
+        state['sums'][w] -= price - (ring[n - w] if n >= w else 0.0)
+        state['ma'][w].pop()
+
+
+def update_ma_state(symbol, ts, prices):
+    """Return {window: ma_list} for the given candles, reusing the cached state
+    when they extend the previous refresh; falls back to a batch compute."""
+    with _MA_LOCK:
+        state = MA_STATE.get(symbol)
+        extended = False
+        if state and len(state['ts']) >= 2:
+            # The last cached candle may still be open, so anchor on the one before it
+            anchor = state['ts'][-2]
+            i = bisect_left(ts, anchor)
+            if i < len(ts) and ts[i] == anchor and prices[i] == state['ring'][-2]:
+                _pop_ma_point(state)
+                for t, p in zip(ts[i + 1:], prices[i + 1:]):
+                    _append_ma_point(state, t, p)
+                extended = len(state['ts']) == len(ts) and state['ts'][0] == ts[0]
+        if not extended:
+            state = _reset_ma_state(symbol, ts, prices)
+        # Same None padding as a batch compute over the displayed window
+        return {w: [None] * min(w - 1, len(ts)) + list(state['ma'][w])[w - 1:] for w in MA_WINDOWS}
+
+
+def get_price_history(symbol):
+    """Return chronological (timestamps, prices) arrays last loaded for symbol."""
+    with _MA_LOCK:
+        state = MA_STATE.get(symbol)
+        if not state:
+            return np.empty(0, dtype='datetime64[ms]'), np.empty(0, dtype=np.float64)
+        return state['ring'].arrays()
+
+
+def get_7day_data(ts, px):
+    """Filter chronological (timestamps, prices) arrays to the last 7 days.
+
+    Timestamps are parsed once at ingest (see _parse_ts) and already sorted, so the
+    cutoff is a binary search and the result is a pair of views, not a copy.
+    """
+    cutoff = np.datetime64('now', 'ms') - np.timedelta64(7, 'D')
+    i = np.searchsorted(ts, cutoff, side='left')
+    return ts[i:], px[i:]
+
+
+# Prompt and system message are built once at import; each call only substitutes the numbers.
+# Everything static (system message + instructions) comes first and the market data last,
+# so the provider's prompt-prefix cache can reuse the identical prefix across calls.
+AI_SYSTEM_MESSAGE = {"role": "system", "content": "You are a professional financial analyst."}
+AI_PROMPT_PREFIX = """As a professional financial analyst, generate a market commentary (150-200 words) based on the 7-day trading data at the end of this message.
+
+Please analyze:
+1. Price trend (upward/downward/sideways)
+2. Relationship with moving averages
+3. Potential market signals
+4. Brief investment recommendation
+
+Format: Direct analysis, no title or numbering.
+
+---DATA---
+"""
+AI_DATA_TEMPLATE = Template("""Symbol: $symbol
+Current Price: $current_price
+7-Day Change: $price_change ($change_pct%)
+7-Day High: $max_price
+7-Day Low: $min_price
+7-Day MA: $ma7
+30-Day MA: $ma30
+Data Points: $data_points""")
+
+
+AI_MODEL = "deepseek-reasoner"
+
+
+def _summary_stats(prices):
+    """Stats fed into the prompt and the summary cache key (NumPy reductions on one array)."""
+    a = np.asarray(prices, dtype=np.float64)
+    current_price = float(a[-1])
+    prev_price = float(a[0])
+    price_change = current_price - prev_price
+    return {
+        'current_price': current_price,
+        'min_price': float(a.min()),
+        'max_price': float(a.max()),
+        'price_change': price_change,
+        'change_pct': (price_change / prev_price * 100) if prev_price != 0 else 0,
+        # Last MA values only need the trailing window, not a full rolling pass
+        'last_ma7': float(a[-7:].mean()) if a.size >= 7 else None,
+        'last_ma30': float(a[-30:].mean()) if a.size >= 30 else None,
+        'data_points': a.size,
+    }
+
+
+def generate_ai_summary(symbol: str, prices, on_delta=None) -> str:
     """
     Generate AI summary for the given symbol using 7-day data.
     
     Args:
         symbol: Trading symbol (e.g., 'GBPUSD')
-        data: List of price data points with 'ts' and 'price' keys
+        prices: Chronological 7-day closing prices (array or list of floats)
+        on_delta: Optional callable receiving each streamed text fragment
     
     Returns:
         Summary string or error message
     """
-    if not client or not DEEPSEEK_API_KEY:
+    client = _get_client()
+    if not client:
         return "⚠️ DeepSeek API not configured. Please set DEEPSEEK_API_KEY environment variable."
     
-    if not data or len(data) < 2:
+    if len(prices) < 2:
         return "⚠️ Insufficient data to generate summary."
     
     try:
-        # Extract prices
-        prices = [d['price'] for d in data]
-        
-        # Calculate basic stats
-        current_price = prices[-1]
-        prev_price = prices[0]
-        min_price = min(prices)
-        max_price = max(prices)
-        price_change = current_price - prev_price
-        change_pct = (price_change / prev_price * 100) if prev_price != 0 else 0
-        
-        # Get MA values
-        ma7 = calculate_ma(prices, 7)
-        ma30 = calculate_ma(prices, 30)
-        
-        # Extract last valid MA values
-        last_ma7 = next((x for x in reversed(ma7) if x is not None), None)
-        last_ma30 = next((x for x in reversed(ma30) if x is not None), None)
-        
-        # Format MA values safely
-        ma7_str = f"{last_ma7:.6f}" if last_ma7 is not None else "N/A"
-        ma30_str = f"{last_ma30:.6f}" if last_ma30 is not None else "N/A"
-        
-        # Build data summary
-        data_summary = f"""
-Symbol: {symbol}
-Current Price: {current_price:.6f}
-7-Day Change: {price_change:+.6f} ({change_pct:+.2f}%)
-7-Day High: {max_price:.6f}
-7-Day Low: {min_price:.6f}
-7-Day MA: {ma7_str}
-30-Day MA: {ma30_str}
-Data Points: {len(data)}
-"""
+        stats = _summary_stats(prices)
+        last_ma7, last_ma30 = stats['last_ma7'], stats['last_ma30']
         
-        # Create prompt for GPT
-        prompt = f"""As a professional financial analyst, generate a market commentary (150-200 words) based on the following 7-day trading data.
-        
-{data_summary}
-
-Please analyze:
-1. Price trend (upward/downward/sideways)
-2. Relationship with moving averages
-3. Potential market signals
-4. Brief investment recommendation
-
-Format: Direct analysis, no title or numbering."""
+        # Create prompt for GPT (MA values formatted safely: N/A until the window is filled)
+        prompt = AI_PROMPT_PREFIX + AI_DATA_TEMPLATE.substitute(
+            symbol=symbol,
+            current_price=f"{stats['current_price']:.6f}",
+            price_change=f"{stats['price_change']:+.6f}",
+            change_pct=f"{stats['change_pct']:+.2f}",
+            max_price=f"{stats['max_price']:.6f}",
+            min_price=f"{stats['min_price']:.6f}",
+            ma7=f"{last_ma7:.6f}" if last_ma7 is not None else "N/A",
+            ma30=f"{last_ma30:.6f}" if last_ma30 is not None else "N/A",
+            data_points=stats['data_points'],
+        )
         
-        # Call DeepSeek API
-        response = client.chat.completions.create(
-            model="deepseek-reasoner",
-            messages=[
-                {"role": "system", "content": "You are a professional financial analyst."},
-                {"role": "user", "content": prompt}
-            ],
+        # Call DeepSeek API (streamed, so partial text can be shown while generating)
+        stream = client.chat.completions.create(
+            model=AI_MODEL,
+            messages=[AI_SYSTEM_MESSAGE, {"role": "user", "content": prompt}],
             temperature=0.7,
             max_tokens=300,
-            timeout=10.0
+            timeout=10.0,
+            stream=True
         )
         
-        summary = response.choices[0].message.content.strip()
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content  # None for reasoning/role-only chunks
+            if delta:
+                parts.append(delta)
+                if on_delta:
+                    on_delta(delta)
+        
+        summary = "".join(parts).strip()
+        
+        # Persist successful summaries (L2); error messages below are never cached
+        if ai_cache and summary:
+            ai_cache.put(_summary_cache_key(symbol, stats), summary)
         return summary
     
     except Exception as e:
@@ -423,235 +624,460 @@ Format: Direct analysis, no title or numbering."""
             return f"❌ AI summary generation failed: {error_msg}"
 
 
+def _price_store_patch(cursor, ts, prices, mas, latest_point):
+    """Build a Patch turning the browser's price-store (described by cursor) into
+    the new window, or return None when a full replacement is needed.
+
+    The browser's last candle (which may still have been open) is found in the new
+    window; candles that slid off the front are deleted, that last candle is
+    replaced and the newer ones appended, and MA slots that fall back into the
+    None padding are cleared.
+    """
+    if not cursor or not ts:
+        return None
+    i = bisect_left(ts, cursor['last_ts'])
+    if i == len(ts) or ts[i] != cursor['last_ts']:
+        return None
+    shift = cursor['n'] - 1 - i
+    if shift < 0:
+        return None
+    
+    patch = Patch()
+    columns = ((patch['historical']['ts'], ts), (patch['historical']['price'], prices),
+               (patch['ma7'], mas[7]), (patch['ma30'], mas[30]))
+    for column, values in columns:
+        for _ in range(shift):
+            del column[0]
+        del column[i]
+        column.extend(values[i:])
+    for w, key in ((7, 'ma7'), (30, 'ma30')):
+        for j in range(max(0, w - 1 - shift), min(w - 1, i)):
+            patch[key][j] = None
+    patch['latest'] = latest_point
+    return patch
+
+
+# Clicks on Refresh Data within this many seconds of the last load of the same symbol are
+# dropped (no /snapshot call, no risk/AI recompute downstream of price-version)
+REFRESH_DEBOUNCE_SEC = 2.0
+_last_refresh = {}  # symbol -> time.monotonic() of the last load
+
+
 @app.callback(
     Output('price-store', 'data'),
+    Output('price-version', 'data'),
+    Output('price-cursor', 'data'),
     Output('status', 'children'),
     Input('refresh-data-btn', 'n_clicks'),
     Input('symbol-dropdown', 'value'),
     Input('interval', 'n_intervals'),
+    State('price-version', 'data'),
+    State('price-cursor', 'data'),
     prevent_initial_call=False
 )
-def load_data(n_clicks, symbol, n_intervals):
-    """Load historical data + latest real-time point separately."""
+def load_data(n_clicks, symbol, n_intervals, version, cursor):
+    """Load historical data + latest real-time point separately.
+
+    Refreshes of the same symbol send a Patch with only the changed candles.
+    """
     symbol = (symbol or 'GBPUSD').strip()
-    
-    # Load raw historical data (more points to ensure good resampling)
-    hist = fetch_history(symbol, limit=2000)
+    now = time.monotonic()
+    if (dash.callback_context.triggered_id == 'refresh-data-btn'
+            and now - _last_refresh.get(symbol, float('-inf')) < REFRESH_DEBOUNCE_SEC):
+        raise PreventUpdate
+    _last_refresh[symbol] = now
+    version = (version or 0) + 1
+    
+    # 5-minute candles aggregated by the API + latest price, one round-trip
+    snapshot = fetch_snapshot(symbol, limit=MAX_DISPLAY_POINTS, interval=CANDLE_INTERVAL)
+    hist = snapshot['history']
     if not hist:
-        return {'historical': [], 'latest': None}, f'Unable to load historical data for {symbol}'
+        with _MA_LOCK:
+            MA_STATE.pop(symbol, None)
+        return {'historical': {'ts': [], 'price': []}, 'latest': None}, version, None, f'Unable to load historical data for {symbol}'
     
-    # Resample to low-frequency (5-minute candles) for clean trends
-    resampled = resample_to_low_frequency(hist, interval_minutes=5)
+    # Older APIs ignore interval and send raw ticks: resample locally (5-minute candles)
+    resampled = hist
+    if snapshot['interval'] != CANDLE_INTERVAL:
+        resampled = resample_to_low_frequency(hist, interval_minutes=5)
     
     # Keep only the most recent 300 resampled points for display
-    if len(resampled) > 300:
-        resampled = resampled[-300:]
+    if len(resampled) > MAX_DISPLAY_POINTS:
+        resampled = resampled[-MAX_DISPLAY_POINTS:]
     
-    # Convert historical data to internal format
-    historical = [{'ts': h['timestamp'], 'price': float(h['price'])} for h in resampled]
+    # Columnar store format: {'ts': [...], 'price': [...]} (no per-point key repetition on the wire)
+    ts = [h['timestamp'] for h in resampled]
+    prices = [float(h['price']) for h in resampled]
     
-    # Fetch the latest single real-time point
+    # Moving averages, incrementally maintained per symbol
+    mas = update_ma_state(symbol, ts, prices)
+    
+    # Latest single real-time point (from the same snapshot)
     latest_point = None
-    latest = fetch_price(symbol)
+    latest = snapshot['latest']
     if latest and 'price' in latest:
         latest_ts = latest.get('timestamp') or datetime.datetime.utcnow().isoformat()
         latest_price = float(latest['price'])
         
         # Only use if it's newer than the last historical point
-        if historical and latest_ts > historical[-1]['ts']:
+        if ts and latest_ts > ts[-1]:
             latest_point = {'ts': latest_ts, 'price': latest_price}
     
     update_time = datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-    status_msg = f'✓ Historical: {len(historical)} points (5-min K-line)'
+    status_msg = f'✓ Historical: {len(ts)} points (5-min K-line)'
     if latest_point:
         status_msg += f' | Latest: {latest_point["price"]:.6f}'
     status_msg += f' | Updated: {update_time} | {symbol}'
     
-    return {'historical': historical, 'latest': latest_point}, status_msg
+    new_cursor = {'symbol': symbol, 'last_ts': ts[-1], 'n': len(ts)} if ts else None
+    patch = None
+    if cursor and cursor.get('symbol') == symbol:
+        patch = _price_store_patch(cursor, ts, prices, mas, latest_point)
+    if patch is not None:
+        return patch, version, new_cursor, status_msg
+    return {'historical': {'ts': ts, 'price': prices}, 'latest': latest_point, 'ma7': mas[7], 'ma30': mas[30]}, version, new_cursor, status_msg
 
 
-@app.callback(
+# Merge SSE-pushed prices into the store as the latest point (assets/callbacks.js)
+app.clientside_callback(
+    ClientsideFunction(namespace='price', function_name='mergeTick'),
+    Output('price-store', 'data', allow_duplicate=True),
+    Input('price-sse', 'message'),
+    State('price-store', 'data'),
+    State('symbol-dropdown', 'value'),
+    prevent_initial_call=True
+)
+
+
+# Build the price figure in the browser from data already in price-store (assets/callbacks.js)
+app.clientside_callback(
+    ClientsideFunction(namespace='graph', function_name='update'),
     Output('price-graph', 'figure'),
     Input('price-store', 'data'),
-    State('symbol-dropdown', 'value')
+    State('symbol-dropdown', 'value'),
+    State('figure-skeleton', 'data')
 )
-def update_graph(data, symbol):
-    symbol = (symbol or 'GBPUSD').strip()
-    
-    # Handle new data structure
-    if not data or not isinstance(data, dict):
-        fig = go.Figure()
-        fig.update_layout(title=f'{symbol} - Waiting for data...')
-        return fig
-    
-    historical = data.get('historical', [])
-    latest_point = data.get('latest')
-    
-    if not historical:
-        fig = go.Figure()
-        fig.update_layout(title=f'{symbol} - No historical data')
-        return fig
-    
-    # Extract historical data for plotting and MA calculation
-    hist_x = [d['ts'] for d in historical]
-    hist_y = [d['price'] for d in historical]
-    
-    # Calculate moving averages on historical data only
-    ma7 = calculate_ma(hist_y, 7)
-    ma30 = calculate_ma(hist_y, 30)
-    
-    # Create figure
-    fig = go.Figure()
-    
-    # Plot 1: Historical price line (smooth, no noise)
-    fig.add_trace(go.Scatter(
-        x=hist_x, 
-        y=hist_y, 
-        mode='lines', 
-        name=f'{symbol} (Historical)',
-        line=dict(color='#1f77b4', width=2),
-        hovertemplate='%{y:.6f}<extra></extra>'
-    ))
-    
-    # Plot 2: MA7 (calculated from historical data)
-    fig.add_trace(go.Scatter(
-        x=hist_x, 
-        y=ma7, 
-        mode='lines', 
-        name='MA7',
-        line=dict(color='#ff7f0e', width=1.5, dash='dash'),
-        hovertemplate='MA7: %{y:.6f}<extra></extra>'
-    ))
-    
-    # Plot 3: MA30 (calculated from historical data)
-    fig.add_trace(go.Scatter(
-        x=hist_x, 
-        y=ma30, 
-        mode='lines', 
-        name='MA30',
-        line=dict(color='#d62728', width=1.5, dash='dot'),
-        hovertemplate='MA30: %{y:.6f}<extra></extra>'
-    ))
-    
-    # Plot 4: Latest real-time point (highlighted)
-    if latest_point:
-        fig.add_trace(go.Scatter(
-            x=[latest_point['ts']], 
-            y=[latest_point['price']], 
-            mode='markers+text',
-            name='Latest Quote',
-            marker=dict(color='#2ca02c', size=12, symbol='star'),
-            text=[f"{latest_point['price']:.6f}"],
-            textposition="top center",
-            textfont=dict(size=10, color='#2ca02c', family='Arial Black'),
-            hovertemplate='Latest: %{y:.6f}<extra></extra>'
-        ))
-        title_suffix = f' + 最新点'
-    else:
-        title_suffix = ''
-    
-    fig.update_layout(
-        title=f'{symbol} - 5分钟K线趋势 ({len(historical)} 点) + MA7/MA30{title_suffix}',
-        xaxis_title='时间',
-        yaxis_title='价格',
-        hovermode='x unified',
-        template='plotly_white',
-        showlegend=True,
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=1.02,
-            xanchor="right",
-            x=1
-        )
-    )
-    
-    return fig
 
 
-# Cache for AI summaries to avoid excessive API calls
-ai_summary_cache = {}
-ai_summary_last_update = {}
+# AI summary cache, two levels:
+# L1: _summary_cache entry per (symbol, 30-minute bucket, refresh salt); the refresh
+#     button bumps the salt to force a miss. Per-process, bounded and expiring.
+# L2: ai_cache (SQLite, shared by workers and restarts) keyed by a SHA256 of the
+#     rounded market inputs, so an L1 miss with unchanged inputs costs no API call.
+AI_SUMMARY_TTL_SEC = 1800  # 30 minutes
+_summary_salt = {}
+
+
+class _TTLCache:
+    """LRU-bounded dict whose entries also expire after ttl seconds."""
+
+    def __init__(self, maxsize=256, ttl=AI_SUMMARY_TTL_SEC):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, stored_at), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if time.time() - item[1] >= self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+_summary_cache = _TTLCache()
+
+# DeepSeek calls can take ~10s, so summaries are generated off the callback thread.
+# _pending_summary maps symbol -> (future, forced, bucket, salt) until the job is rendered.
+AI_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ai-summary')
+AI_CACHE_HIT_WAIT_SEC = 0.1  # cache hits finish within this; misses fall back to polling
+_pending_summary = {}
+_summary_partial = {}  # symbol -> streamed fragments of the summary being generated
+
+
+class _SummaryNotGenerated(Exception):
+    """Raised inside _cached_summary so that failed attempts are never cached."""
+
+    def __init__(self, reason, value=0):
+        super().__init__(reason)
+        self.reason = reason  # "insufficient_data", "daily_cap" or "cooldown"
+        self.value = value    # data point count or seconds to wait
+
+
+def _summary_cache_key(symbol, stats):
+    return ai_cache.make_key(symbol, AI_MODEL, stats['current_price'], stats['last_ma7'],
+                             stats['last_ma30'], int(time.time() // AI_SUMMARY_TTL_SEC))
+
+
+def _latest_7day(symbol):
+    """Return the last 7 days of closing prices for symbol from the PriceRing."""
+    _, px = get_7day_data(*get_price_history(symbol))
+    return px
+
+
+def _cached_summary(symbol, bucket, salt):
+    """Return (summary, generated_at) for a cache key, generating it on a miss."""
+    key = (symbol, bucket, salt)
+    hit = _summary_cache.get(key)
+    if hit:
+        return hit
+    
+    seven_day_data = _latest_7day(symbol)
+    if len(seven_day_data) < 2:
+        raise _SummaryNotGenerated("insufficient_data", len(seven_day_data))
+
+    # L2 hit: same market inputs already summarized this bucket (no API call, no usage recorded)
+    if ai_cache:
+        hit = ai_cache.get(_summary_cache_key(symbol, _summary_stats(seven_day_data)), AI_SUMMARY_TTL_SEC)
+        if hit:
+            _summary_cache.set(key, hit)
+            return hit
+
+    # Rate-limiting: check and record the call in one step, so the two AI workers
+    # cannot both pass the same check (usage is only recorded when the API is configured)
+    allowed, reason, wait = (True, "ok", 0)
+    acquire = try_acquire if DEEPSEEK_API_KEY else can_call
+    if acquire:
+        try:
+            allowed, reason, wait = acquire(MAX_CALLS_PER_DAY, SUMMARY_COOLDOWN_SEC)
+        except Exception:
+            allowed, reason, wait = True, "ok", 0
+    if not allowed:
+        raise _SummaryNotGenerated(reason, wait)
+
+    partial = _summary_partial[symbol] = []
+    summary = generate_ai_summary(symbol, seven_day_data, on_delta=partial.append)
+
+    result = (summary, time.time())
+    _summary_cache.set(key, result)
+    return result
+
+
+def _render_summary(symbol, fut, forced, bucket, salt):
+    """Turn a finished _cached_summary future into the ai-summary text."""
+    try:
+        summary, generated_at = fut.result()
+        if forced:
+            _summary_salt[symbol] = salt + 1
+    except _SummaryNotGenerated as e:
+        if e.reason == "insufficient_data":
+            return f"⏳ Insufficient data points ({e.value}/2), collecting..."
+        
+        # If blocked, prefer serving the summary cached for this bucket
+        cached = None
+        if forced:
+            hit = _summary_cache.get((symbol, bucket, salt))
+            if hit:
+                cached = hit[0]
+        if cached:
+            if e.reason == "daily_cap":
+                hrs = max(1, e.value // 3600)
+                return f"{cached}\n\n⛔ Daily AI limit reached. Can refresh in ~{hrs} hour(s)."
+            mins = max(1, e.value // 60)
+            return f"{cached}\n\n⏳ Cooldown period (~{mins} min until next refresh)."
+        if e.reason == "daily_cap":
+            hrs = max(1, e.value // 3600)
+            return f"⛔ Daily AI calls exhausted. Please try again in ~{hrs} hour(s)."
+        mins = max(1, e.value // 60)
+        return f"⏳ Cooldown period, please try again in ~{mins} min."
+    
+    minutes_ago = int((time.time() - generated_at) / 60)
+    if minutes_ago < 1:
+        return f"{summary}\n\n🕐 Just updated"
+    return f"{summary}\n\n🕐 Cached analysis (generated {minutes_ago} min ago) · Click [🔄 Refresh Analysis] to update"
+
 
 @app.callback(
     Output('ai-summary', 'children'),
+    Output('ai-poll', 'disabled'),
     Input('refresh-summary-btn', 'n_clicks'),
-    Input('price-store', 'data'),
+    Input('price-version', 'data'),
+    Input('ai-poll', 'n_intervals'),
     State('symbol-dropdown', 'value'),
     prevent_initial_call=False
 )
-def update_ai_summary(n_clicks, data, symbol):
-    """Update AI summary. Only calls API when refresh button is clicked or cache is old."""
+def update_ai_summary(n_clicks, version, n_poll, symbol):
+    """Update AI summary. Only calls API when refresh button is clicked or cache is old.
+
+    Generation runs on AI_EXECUTOR; while it is pending a placeholder is shown and
+    the ai-poll interval stays enabled until the result can be rendered.
+    """
     symbol = (symbol or 'GBPUSD').strip()
-    data = data or []
-    
-    if not data:
-        return "⏳ Waiting for data... (Click [🔄 Refresh Analysis] to generate AI commentary)"
-    
-    # Check if we have cached summary
-    import time
-    current_time = time.time()
     
-    # If button never clicked and no cache, show prompt
-    if n_clicks == 0 and symbol not in ai_summary_cache:
-        return "💡 Click [🔄 Refresh Analysis] button to generate AI market commentary (saves API usage)"
-    
-    # Check cache (30 minutes = 1800 seconds)
-    cache_duration = 1800  # 30 minutes
-    
-    if symbol in ai_summary_cache and n_clicks == 0:
-        last_update = ai_summary_last_update.get(symbol, 0)
-        if current_time - last_update < cache_duration:
-            # Return cached summary with timestamp
-            minutes_ago = int((current_time - last_update) / 60)
-            return f"{ai_summary_cache[symbol]}\n\n🕐 Cached analysis (generated {minutes_ago} min ago) · Click [🔄 Refresh Analysis] to update"
-    
-    # Extract 7-day data
-    seven_day_data = get_7day_data(data)
-    
-    if len(seven_day_data) < 2:
-        return f"⏳ Insufficient data points ({len(seven_day_data)}/2), collecting..."
-    
-    # Rate-limiting: check allowance before calling API
-    allowed, reason, wait = (True, "ok", 0)
-    if can_call:
-        try:
-            allowed, reason, wait = can_call(MAX_CALLS_PER_DAY, SUMMARY_COOLDOWN_SEC)
-        except Exception:
-            allowed, reason, wait = True, "ok", 0
+    if not version:
+        return "⏳ Waiting for data... (Click [🔄 Refresh Analysis] to generate AI commentary)", True
+    
+    # If button never clicked, show prompt
+    if not n_clicks:
+        return "💡 Click [🔄 Refresh Analysis] button to generate AI market commentary (saves API usage)", True
+    
+    # Reuse a job still running for this symbol; otherwise submit (cache hits return almost at once)
+    pending = _pending_summary.get(symbol)
+    forced = dash.callback_context.triggered_id == 'refresh-summary-btn'
+    if pending is None or (forced and pending[0].done()):
+        bucket = int(time.time() // AI_SUMMARY_TTL_SEC)
+        salt = _summary_salt.get(symbol, 0)
+        fut = AI_EXECUTOR.submit(_cached_summary, symbol, bucket, salt + 1 if forced else salt)
+        pending = _pending_summary[symbol] = (fut, forced, bucket, salt)
+    
+    fut, forced, bucket, salt = pending
+    wait([fut], timeout=AI_CACHE_HIT_WAIT_SEC)
+    if not fut.done():
+        partial = "".join(_summary_partial.get(symbol, ()))
+        if partial:
+            return f"{partial}\n\n⏳ 生成中...", False
+        return "⏳ 生成中... Generating AI market commentary", False
+    
+    _pending_summary.pop(symbol, None)
+    _summary_partial.pop(symbol, None)
+    return _render_summary(symbol, fut, forced, bucket, salt), True
 
-    if not allowed:
-        # If blocked, prefer serving cached summary if available
-        if symbol in ai_summary_cache:
-            if reason == "daily_cap":
-                hrs = max(1, wait // 3600)
-                return f"{ai_summary_cache[symbol]}\n\n⛔ Daily AI limit reached. Can refresh in ~{hrs} hour(s)."
-            else:
-                mins = max(1, wait // 60)
-                return f"{ai_summary_cache[symbol]}\n\n⏳ Cooldown period (~{mins} min until next refresh)."
-        else:
-            if reason == "daily_cap":
-                hrs = max(1, wait // 3600)
-                return f"⛔ Daily AI calls exhausted. Please try again in ~{hrs} hour(s)."
-            else:
-                mins = max(1, wait // 60)
-                return f"⏳ Cooldown period, please try again in ~{mins} min."
-
-    # Generate AI summary (only when button clicked or cache expired)
-    summary = generate_ai_summary(symbol, seven_day_data)
-
-    # Record usage after a real API attempt
-    if record_call and client and DEEPSEEK_API_KEY:
-        try:
-            record_call()
-        except Exception:
-            pass
-    
-    # Update cache
-    ai_summary_cache[symbol] = summary
-    ai_summary_last_update[symbol] = current_time
-    
-    return f"{summary}\n\n🕐 Just updated"
+
+# ---- Risk banner / panel styles ----
+# Shared by every render instead of rebuilding dozens of style dicts per callback; treat as read-only.
+_RISK_BANNER_STYLES = {
+    'MEDIUM': {
+        'backgroundColor': '#fff3e0',
+        'borderLeft': '6px solid #ff9800',
+        'color': '#e65100',
+        'icon': '⚠️'
+    },
+    'HIGH': {
+        'backgroundColor': '#ffebee',
+        'borderLeft': '6px solid #f44336',
+        'color': '#c62828',
+        'icon': '🚨'
+    },
+    'CRITICAL': {
+        'backgroundColor': '#ffcdd2',
+        'borderLeft': '6px solid #b71c1c',
+        'color': '#b71c1c',
+        'icon': '🔴'
+    }
+}
+
+_RISK_BANNER_BOX_STYLE = {
+    level: {
+        'padding': '16px 20px',
+        'backgroundColor': cfg['backgroundColor'],
+        'borderLeft': cfg['borderLeft'],
+        'borderRadius': '4px',
+        'color': cfg['color'],
+        'boxShadow': '0 2px 8px rgba(0,0,0,0.1)',
+        'animation': 'pulse 2s ease-in-out infinite'
+    }
+    for level, cfg in _RISK_BANNER_STYLES.items()
+}
+_BANNER_TITLE_STYLE = {'margin': '0 0 8px 0', 'fontSize': '18px', 'fontWeight': 'bold'}
+_BANNER_SUBTITLE_STYLE = {'margin': '0 0 12px 0', 'fontSize': '14px', 'opacity': '0.9'}
+_BANNER_SIGNAL_TYPE_STYLE = {'fontWeight': 'bold', 'fontSize': '13px'}
+_BANNER_SIGNAL_TEXT_STYLE = {'fontSize': '13px'}
+
+# 风险等级颜色
+_RISK_COLORS = {
+    'MINIMAL': '#4caf50',
+    'LOW': '#8bc34a',
+    'MEDIUM': '#ff9800',
+    'HIGH': '#ff5722',
+    'CRITICAL': '#d32f2f'
+}
+
+# 风险等级英文（保持原文）
+_RISK_LEVEL_EN = {
+    'MINIMAL': 'Minimal',
+    'LOW': 'Low',
+    'MEDIUM': 'Medium',
+    'HIGH': 'High',
+    'CRITICAL': 'Critical'
+}
+
+
+def _risk_card_styles(risk_color, elevated):
+    """(card, level title, score number) styles for one risk colour."""
+    card = {
+        'display': 'flex',
+        'alignItems': 'center',
+        'padding': '16px',
+        'backgroundColor': '#fff',
+        'border': f'2px solid {risk_color}',
+        'borderRadius': '8px',
+        'marginBottom': '16px',
+        'boxShadow': '0 4px 12px rgba(211, 47, 47, 0.3)' if elevated else '0 2px 4px rgba(0,0,0,0.1)',
+        'animation': 'borderPulse 2s ease-in-out infinite' if elevated else 'none'
+    }
+    title = {'margin': '0', 'color': risk_color}
+    score = {'fontSize': '36px', 'fontWeight': 'bold', 'color': risk_color, 'lineHeight': '1'}
+    return card, title, score
+
+
+# risk_level -> precomputed card styles (unknown levels fall back to grey)
+_RISK_CARD_STYLES = {level: _risk_card_styles(color, level in ('HIGH', 'CRITICAL'))
+                     for level, color in _RISK_COLORS.items()}
+_RISK_CARD_STYLES_UNKNOWN = _risk_card_styles('#999', False)
+
+_MUTED_STYLE = {'color': '#999'}
+_ERROR_STYLE = {'color': '#f44336'}
+_NOTICE_STYLE = {'color': '#ff9800'}
+_SCORE_TEXT_STYLE = {'margin': '5px 0 0 0', 'fontSize': '14px', 'color': '#666'}
+_FLEX_FILL_STYLE = {'flex': '1'}
+_ALIGN_RIGHT_STYLE = {'textAlign': 'right'}
+_SECTION_STYLE = {'marginBottom': '16px'}
+_SECTION_TITLE_STYLE = {'margin': '0 0 12px 0', 'fontSize': '16px'}
+_METRIC_BLOCK_STYLE = {
+    'padding': '12px',
+    'backgroundColor': '#f5f5f5',
+    'borderRadius': '6px',
+    'fontSize': '14px'
+}
+_FACTORS_BLOCK_STYLE = {
+    'padding': '12px',
+    'backgroundColor': '#f5f5f5',
+    'borderRadius': '6px'
+}
+_METRIC_ROW_STYLE = {'marginBottom': '8px'}
+_METRIC_LABEL_STYLE = {'color': '#666'}
+_METRIC_VALUE_STYLE = {'fontWeight': 'bold'}
+_VALUE_ALERT_STYLE = {'fontWeight': 'bold', 'color': '#f44336'}
+_VALUE_OK_STYLE = {'fontWeight': 'bold', 'color': '#4caf50'}
+_VOLATILITY_HIGH_STYLE = {'fontWeight': 'bold', 'color': '#ff5722'}
+_VOLATILITY_NORMAL_STYLE = {'fontWeight': 'bold', 'color': '#333'}
+_HIGH_TAG_STYLE = {'color': '#f44336', 'marginLeft': '8px'}
+_Z_TAG_ALERT_STYLE = {'marginLeft': '8px', 'color': '#f44336'}
+_Z_TAG_OK_STYLE = {'marginLeft': '8px', 'color': '#4caf50'}
+
+_SIGNAL_ICON_BY_SEVERITY = {'CRITICAL': "🔴 ", 'WARNING': "🟡 ", 'INFO': "🔵 "}
+_SIGNAL_STYLE_BY_SEVERITY = {
+    severity: {
+        'padding': '12px',
+        'backgroundColor': bg,
+        'borderLeft': f'4px solid {border}',
+        'borderRadius': '4px',
+        'marginBottom': '12px'
+    }
+    for severity, bg, border in (('CRITICAL', '#ffebee', '#f44336'),
+                                 ('WARNING', '#fff3e0', '#ff9800'),
+                                 ('INFO', '#e3f2fd', '#2196f3'))
+}
+_SIGNAL_ICON_STYLE = {'fontSize': '18px'}
+_SIGNAL_TYPE_STYLE = {'fontWeight': 'bold', 'fontSize': '14px'}
+_SIGNAL_HEADER_STYLE = {'marginBottom': '6px'}
+_SIGNAL_MESSAGE_STYLE = {'marginBottom': '6px', 'color': '#666', 'fontSize': '13px'}
+_SIGNAL_HINT_ICON_STYLE = {'fontSize': '14px'}
+_SIGNAL_HINT_STYLE = {'fontSize': '13px', 'fontStyle': 'italic', 'color': '#555'}
+_NO_SIGNALS_STYLE = {'padding': '12px', 'backgroundColor': '#e8f5e9', 'borderRadius': '4px', 'color': '#4caf50'}
+_FACTOR_STYLE = {'marginBottom': '6px', 'fontSize': '14px'}
+_NO_FACTORS_STYLE = {'color': '#4caf50', 'fontSize': '14px'}
 
 
 @app.callback(
@@ -672,32 +1098,10 @@ def update_risk_alert_banner(risk_data, symbol):
     signals = risk_data.get('signals', [])
     
     # Only show banner for MEDIUM, HIGH, or CRITICAL risk
-    if risk_level not in ['MEDIUM', 'HIGH', 'CRITICAL']:
+    if risk_level not in _RISK_BANNER_STYLES:
         return None
     
-    # Banner styling based on risk level
-    banner_styles = {
-        'MEDIUM': {
-            'backgroundColor': '#fff3e0',
-            'borderLeft': '6px solid #ff9800',
-            'color': '#e65100',
-            'icon': '⚠️'
-        },
-        'HIGH': {
-            'backgroundColor': '#ffebee',
-            'borderLeft': '6px solid #f44336',
-            'color': '#c62828',
-            'icon': '🚨'
-        },
-        'CRITICAL': {
-            'backgroundColor': '#ffcdd2',
-            'borderLeft': '6px solid #b71c1c',
-            'color': '#b71c1c',
-            'icon': '🔴'
-        }
-    }
-    
-    style_config = banner_styles.get(risk_level, banner_styles['MEDIUM'])
+    style_config = _RISK_BANNER_STYLES[risk_level]
     
     # Count critical signals
     critical_count = sum(1 for s in signals if s.get('severity') == 'CRITICAL')
@@ -722,80 +1126,77 @@ def update_risk_alert_banner(risk_data, symbol):
     return html.Div([
         html.Div([
             html.Div([
-                html.H3(alert_title, style={
-                    'margin': '0 0 8px 0',
-                    'fontSize': '18px',
-                    'fontWeight': 'bold'
-                }),
-                html.P(alert_subtitle, style={
-                    'margin': '0 0 12px 0',
-                    'fontSize': '14px',
-                    'opacity': '0.9'
-                }),
+                html.H3(alert_title, style=_BANNER_TITLE_STYLE),
+                html.P(alert_subtitle, style=_BANNER_SUBTITLE_STYLE),
                 html.Div([
                     html.Div([
-                        html.Span(f"• {s['type']}: ", style={'fontWeight': 'bold', 'fontSize': '13px'}),
-                        html.Span(s['recommendation'], style={'fontSize': '13px'})
-                    ], style={'marginBottom': '6px'})
+                        html.Span(f"• {s['type']}: ", style=_BANNER_SIGNAL_TYPE_STYLE),
+                        html.Span(s['recommendation'], style=_BANNER_SIGNAL_TEXT_STYLE)
+                    ], style=_SIGNAL_HEADER_STYLE)
                     for s in priority_signals
                 ]) if priority_signals else None
             ])
-        ], style={
-            'padding': '16px 20px',
-            'backgroundColor': style_config['backgroundColor'],
-            'borderLeft': style_config['borderLeft'],
-            'borderRadius': '4px',
-            'color': style_config['color'],
-            'boxShadow': '0 2px 8px rgba(0,0,0,0.1)',
-            'animation': 'pulse 2s ease-in-out infinite'
-        })
-    ], style={
-        'marginBottom': '16px'
-    })
+        ], style=_RISK_BANNER_BOX_STYLE[risk_level])
+    ], style=_SECTION_STYLE)
+
+
+# symbol -> (price bytes, (report, panel)) of the last OK risk analysis; each
+# session's price-version bump re-runs the callback, but the candles it reads are
+# shared, so unchanged prices reuse the previous result
+_RISK_CACHE = {}
+
+# One engine for every callback: get_risk_report keeps no per-call state
+_RISK_ENGINE = RiskEngine(
+    volatility_window=20,
+    anomaly_threshold=2.5,
+    high_volatility_threshold=0.015
+) if RiskEngine else None
+
+# Load the numba kernel in the background at startup instead of in the first risk callback
+if warm_up_risk_engine:
+    threading.Thread(target=warm_up_risk_engine, name='risk-warmup', daemon=True).start()
 
 
 @app.callback(
     Output('risk-store', 'data'),
     Output('risk-panel', 'children'),
-    Input('price-store', 'data'),
+    Input('price-version', 'data'),
     State('symbol-dropdown', 'value')
 )
-def update_risk_analysis(data, symbol):
+def update_risk_analysis(version, symbol):
     """实时风险分析和监控"""
     symbol = (symbol or 'GBPUSD').strip()
     
-    # 检查数据
-    if not data or not isinstance(data, dict):
-        return {}, html.Div("Waiting for data...", style={'color': '#999'})
+    # 检查数据（价格序列直接取自服务端 PriceRing）
+    if not version:
+        return {}, html.Div("Waiting for data...", style=_MUTED_STYLE)
     
-    historical = data.get('historical', [])
-    if not historical or len(historical) < 20:
-        return {}, html.Div("Insufficient data, at least 20 data points required for risk analysis", style={'color': '#999'})
+    _, prices = get_price_history(symbol)
+    if len(prices) < 20:
+        return {}, html.Div("Insufficient data, at least 20 data points required for risk analysis", style=_MUTED_STYLE)
     
     # 检查风险引擎是否可用
-    if not RiskEngine:
-        return {}, html.Div("⚠️ 风险引擎模块未加载", style={'color': '#f44336'})
+    if _RISK_ENGINE is None:
+        return {}, html.Div("⚠️ 风险引擎模块未加载", style=_ERROR_STYLE)
     
-    # 提取价格序列
-    prices = [float(d['price']) for d in historical]
-    
-    # 初始化风险引擎
-    engine = RiskEngine(
-        volatility_window=20,
-        anomaly_threshold=2.5,
-        high_volatility_threshold=0.015
-    )
+    # 价格序列与上次相同（其他会话、或刷新未带来新数据）时直接复用结果；
+    # 报告的 timestamp 表示"截至此时"，命中缓存时刷新为当前时间（浅拷贝，不改缓存）
+    key = prices.tobytes()
+    cached = _RISK_CACHE.get(symbol)
+    if cached and cached[0] == key:
+        report, panel = cached[1]
+        return {**report, 'timestamp': datetime.datetime.utcnow().isoformat()}, panel
     
     # 生成风险报告
     try:
-        report = engine.get_risk_report(prices)
+        report = _RISK_ENGINE.get_risk_report(prices)
     except Exception as e:
-        return {}, html.Div(f"❌ 风险分析失败: {str(e)}", style={'color': '#f44336'})
+        return {}, html.Div(f"❌ 风险分析失败: {str(e)}", style=_ERROR_STYLE)
     
     if report.get('status') != 'OK':
         return report, html.Div(
             f"⚠️ {report.get('message', '无法生成风险报告')}",
-            style={'color': '#ff9800'}
+            style=_NOTICE_STYLE
         )
     
     # 构建风险面板UI
@@ -804,181 +1205,128 @@ def update_risk_analysis(data, symbol):
     anomalies = report['anomalies']
     signals = report['signals']
     
-    # 风险等级颜色
-    risk_colors = {
-        'MINIMAL': '#4caf50',
-        'LOW': '#8bc34a',
-        'MEDIUM': '#ff9800',
-        'HIGH': '#ff5722',
-        'CRITICAL': '#d32f2f'
-    }
-    
     risk_level = summary['risk_level']
-    risk_color = risk_colors.get(risk_level, '#999')
-    
-    # 风险等级英文（保持原文）
-    risk_level_en = {
-        'MINIMAL': 'Minimal',
-        'LOW': 'Low',
-        'MEDIUM': 'Medium',
-        'HIGH': 'High',
-        'CRITICAL': 'Critical'
-    }
+    card_style, level_style, score_style = _RISK_CARD_STYLES.get(risk_level, _RISK_CARD_STYLES_UNKNOWN)
+    z_alert = abs(anomalies['latest_z_score']) > 2.5
     
     panel_children = [
         # 风险摘要卡片
         html.Div([
             html.Div([
                 html.Div([
-                    html.H4(f"Risk Level: {risk_level_en.get(risk_level, risk_level)}", 
-                           style={'margin': '0', 'color': risk_color}),
-                    html.P(f"Score: {summary['risk_score']}/100", 
-                          style={'margin': '5px 0 0 0', 'fontSize': '14px', 'color': '#666'})
-                ], style={'flex': '1'}),
+                    html.H4(f"Risk Level: {_RISK_LEVEL_EN.get(risk_level, risk_level)}", style=level_style),
+                    html.P(f"Score: {summary['risk_score']}/100", style=_SCORE_TEXT_STYLE)
+                ], style=_FLEX_FILL_STYLE),
                 html.Div([
-                    html.Div(
-                        f"{summary['risk_score']}",
-                        style={
-                            'fontSize': '36px',
-                            'fontWeight': 'bold',
-                            'color': risk_color,
-                            'lineHeight': '1'
-                        }
-                    )
-                ], style={'textAlign': 'right'})
-            ], style={
-                'display': 'flex',
-                'alignItems': 'center',
-                'padding': '16px',
-                'backgroundColor': '#fff',
-                'border': f'2px solid {risk_color}',
-                'borderRadius': '8px',
-                'marginBottom': '16px',
-                'boxShadow': '0 4px 12px rgba(211, 47, 47, 0.3)' if risk_level in ['HIGH', 'CRITICAL'] else '0 2px 4px rgba(0,0,0,0.1)',
-                'animation': 'borderPulse 2s ease-in-out infinite' if risk_level in ['HIGH', 'CRITICAL'] else 'none'
-            })
+                    html.Div(f"{summary['risk_score']}", style=score_style)
+                ], style=_ALIGN_RIGHT_STYLE)
+            ], style=card_style)
         ]),
         
         # Volatility Metrics
         html.Div([
-            html.H4("📊 Volatility Analysis", style={'margin': '0 0 12px 0', 'fontSize': '16px'}),
+            html.H4("📊 Volatility Analysis", style=_SECTION_TITLE_STYLE),
             html.Div([
                 html.Div([
-                    html.Span("Current Volatility: ", style={'color': '#666'}),
+                    html.Span("Current Volatility: ", style=_METRIC_LABEL_STYLE),
                     html.Span(f"{volatility['current_volatility']:.4f}", 
-                             style={'fontWeight': 'bold', 'color': '#ff5722' if volatility['is_high_volatility'] else '#333'})
-                ], style={'marginBottom': '8px'}),
+                             style=_VOLATILITY_HIGH_STYLE if volatility['is_high_volatility'] else _VOLATILITY_NORMAL_STYLE)
+                ], style=_METRIC_ROW_STYLE),
                 html.Div([
-                    html.Span("Average Volatility: ", style={'color': '#666'}),
-                    html.Span(f"{volatility['avg_volatility']:.4f}", style={'fontWeight': 'bold'})
-                ], style={'marginBottom': '8px'}),
+                    html.Span("Average Volatility: ", style=_METRIC_LABEL_STYLE),
+                    html.Span(f"{volatility['avg_volatility']:.4f}", style=_METRIC_VALUE_STYLE)
+                ], style=_METRIC_ROW_STYLE),
                 html.Div([
-                    html.Span("Volatility Percentile: ", style={'color': '#666'}),
-                    html.Span(f"{volatility['volatility_percentile']:.1f}%", style={'fontWeight': 'bold'}),
+                    html.Span("Volatility Percentile: ", style=_METRIC_LABEL_STYLE),
+                    html.Span(f"{volatility['volatility_percentile']:.1f}%", style=_METRIC_VALUE_STYLE),
                     html.Span(
                         " 🔥 High" if volatility['volatility_percentile'] > 80 else "",
-                        style={'color': '#f44336', 'marginLeft': '8px'}
+                        style=_HIGH_TAG_STYLE
                     )
-                ], style={'marginBottom': '8px'}),
+                ], style=_METRIC_ROW_STYLE),
                 html.Div([
-                    html.Span("Status: ", style={'color': '#666'}),
+                    html.Span("Status: ", style=_METRIC_LABEL_STYLE),
                     html.Span(
                         "⚠️ High Volatility" if volatility['is_high_volatility'] else "✅ Normal",
-                        style={'fontWeight': 'bold', 'color': '#f44336' if volatility['is_high_volatility'] else '#4caf50'}
+                        style=_VALUE_ALERT_STYLE if volatility['is_high_volatility'] else _VALUE_OK_STYLE
                     )
                 ])
-            ], style={
-                'padding': '12px',
-                'backgroundColor': '#f5f5f5',
-                'borderRadius': '6px',
-                'fontSize': '14px'
-            })
-        ], style={'marginBottom': '16px'}),
+            ], style=_METRIC_BLOCK_STYLE)
+        ], style=_SECTION_STYLE),
         
         # Anomaly Detection
         html.Div([
-            html.H4("🔍 Anomaly Detection", style={'margin': '0 0 12px 0', 'fontSize': '16px'}),
+            html.H4("🔍 Anomaly Detection", style=_SECTION_TITLE_STYLE),
             html.Div([
                 html.Div([
-                    html.Span("Anomaly Count: ", style={'color': '#666'}),
+                    html.Span("Anomaly Count: ", style=_METRIC_LABEL_STYLE),
                     html.Span(
                         f"{anomalies['count']}", 
-                        style={'fontWeight': 'bold', 'color': '#f44336' if anomalies['count'] > 0 else '#4caf50'}
+                        style=_VALUE_ALERT_STYLE if anomalies['count'] > 0 else _VALUE_OK_STYLE
                     )
-                ], style={'marginBottom': '8px'}),
+                ], style=_METRIC_ROW_STYLE),
                 html.Div([
-                    html.Span("Latest Z-score: ", style={'color': '#666'}),
-                    html.Span(f"{anomalies['latest_z_score']:.2f}", style={'fontWeight': 'bold'}),
+                    html.Span("Latest Z-score: ", style=_METRIC_LABEL_STYLE),
+                    html.Span(f"{anomalies['latest_z_score']:.2f}", style=_METRIC_VALUE_STYLE),
                     html.Span(
-                        " ⚠️ Anomaly" if abs(anomalies['latest_z_score']) > 2.5 else " ✅ Normal",
-                        style={'marginLeft': '8px', 'color': '#f44336' if abs(anomalies['latest_z_score']) > 2.5 else '#4caf50'}
+                        " ⚠️ Anomaly" if z_alert else " ✅ Normal",
+                        style=_Z_TAG_ALERT_STYLE if z_alert else _Z_TAG_OK_STYLE
                     )
-                ], style={'marginBottom': '8px'}),
+                ], style=_METRIC_ROW_STYLE),
                 html.Div([
-                    html.Span("Status: ", style={'color': '#666'}),
+                    html.Span("Status: ", style=_METRIC_LABEL_STYLE),
                     html.Span(
                         "🚨 Anomaly Detected" if anomalies['detected'] else "✅ No Anomaly",
-                        style={'fontWeight': 'bold', 'color': '#f44336' if anomalies['detected'] else '#4caf50'}
+                        style=_VALUE_ALERT_STYLE if anomalies['detected'] else _VALUE_OK_STYLE
                     )
                 ])
-            ], style={
-                'padding': '12px',
-                'backgroundColor': '#f5f5f5',
-                'borderRadius': '6px',
-                'fontSize': '14px'
-            })
-        ], style={'marginBottom': '16px'}),
+            ], style=_METRIC_BLOCK_STYLE)
+        ], style=_SECTION_STYLE),
         
         # Risk Signals
         html.Div([
-            html.H4(f"⚠️ Risk Signals ({len(signals)})", style={'margin': '0 0 12px 0', 'fontSize': '16px'}),
+            html.H4(f"⚠️ Risk Signals ({len(signals)})", style=_SECTION_TITLE_STYLE),
             html.Div([
                 html.Div([
                     html.Div([
                         html.Span(
-                            "🔴 " if s['severity'] == 'CRITICAL' else "🟡 " if s['severity'] == 'WARNING' else "🔵 ",
-                            style={'fontSize': '18px'}
+                            _SIGNAL_ICON_BY_SEVERITY.get(s['severity'], _SIGNAL_ICON_BY_SEVERITY['INFO']),
+                            style=_SIGNAL_ICON_STYLE
                         ),
-                        html.Span(f"{s['type']}", style={'fontWeight': 'bold', 'fontSize': '14px'})
-                    ], style={'marginBottom': '6px'}),
-                    html.Div(s['message'], style={'marginBottom': '6px', 'color': '#666', 'fontSize': '13px'}),
+                        html.Span(f"{s['type']}", style=_SIGNAL_TYPE_STYLE)
+                    ], style=_SIGNAL_HEADER_STYLE),
+                    html.Div(s['message'], style=_SIGNAL_MESSAGE_STYLE),
                     html.Div([
-                        html.Span("💡 ", style={'fontSize': '14px'}),
-                        html.Span(s['recommendation'], style={'fontSize': '13px', 'fontStyle': 'italic', 'color': '#555'})
+                        html.Span("💡 ", style=_SIGNAL_HINT_ICON_STYLE),
+                        html.Span(s['recommendation'], style=_SIGNAL_HINT_STYLE)
                     ])
-                ], style={
-                    'padding': '12px',
-                    'backgroundColor': '#fff3e0' if s['severity'] == 'WARNING' else '#ffebee' if s['severity'] == 'CRITICAL' else '#e3f2fd',
-                    'borderLeft': f"4px solid {'#ff9800' if s['severity'] == 'WARNING' else '#f44336' if s['severity'] == 'CRITICAL' else '#2196f3'}",
-                    'borderRadius': '4px',
-                    'marginBottom': '12px'
-                })
+                ], style=_SIGNAL_STYLE_BY_SEVERITY.get(s['severity'], _SIGNAL_STYLE_BY_SEVERITY['INFO']))
                 for s in signals
             ]) if signals else html.Div(
                 "✅ No risk signals, market condition is good",
-                style={'padding': '12px', 'backgroundColor': '#e8f5e9', 'borderRadius': '4px', 'color': '#4caf50'}
+                style=_NO_SIGNALS_STYLE
             )
-        ], style={'marginBottom': '16px'}),
+        ], style=_SECTION_STYLE),
         
         # Risk Factors
         html.Div([
-            html.H4("📋 Risk Factors", style={'margin': '0 0 12px 0', 'fontSize': '16px'}),
+            html.H4("📋 Risk Factors", style=_SECTION_TITLE_STYLE),
             html.Div([
-                html.Div(f"• {factor}", style={'marginBottom': '6px', 'fontSize': '14px'})
+                html.Div(f"• {factor}", style=_FACTOR_STYLE)
                 for factor in report['risk_factors']
             ]) if report['risk_factors'] else html.Div(
                 "✅ No significant risk factors detected",
-                style={'color': '#4caf50', 'fontSize': '14px'}
+                style=_NO_FACTORS_STYLE
             )
-        ], style={
-            'padding': '12px',
-            'backgroundColor': '#f5f5f5',
-            'borderRadius': '6px'
-        })
+        ], style=_FACTORS_BLOCK_STYLE)
     ]
     
-    return report, html.Div(panel_children)
+    result = report, html.Div(panel_children)
+    _RISK_CACHE[symbol] = (key, result)
+    return result
 
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=8050)
+    app.run(debug=os.getenv('DASH_DEBUG') == '1',
+            host=os.getenv('DASHBOARD_HOST', '0.0.0.0'),
+            port=int(os.getenv('DASHBOARD_PORT', '8050')))
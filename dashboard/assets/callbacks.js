@@ -0,0 +1,66 @@
+// Clientside callbacks for the dashboard (registered in app.py via ClientsideFunction).
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    price: {
+        // Merge an SSE-pushed price into the store as the latest point
+        mergeTick: function(message, data, symbol) {
+            var no_update = window.dash_clientside.no_update;
+            if (!message || !data || !data.historical || !data.historical.ts.length) {
+                return no_update;
+            }
+            var point = JSON.parse(message);
+            if (point.symbol !== (symbol || 'GBPUSD').trim()) {
+                return no_update;
+            }
+            var ts = data.historical.ts;
+            var lastTs = ts[ts.length - 1];
+            if (point.timestamp <= lastTs || (data.latest && point.timestamp <= data.latest.ts)) {
+                return no_update;
+            }
+            return Object.assign({}, data, {latest: {ts: point.timestamp, price: point.price}});
+        }
+    },
+
+    graph: {
+        // Build the price figure from price-store and the static figure skeleton
+        update: function(data, symbol, skeleton) {
+            symbol = (symbol || 'GBPUSD').trim();
+            // Plotly writes autorange state into layout objects, so copy the small ones per render
+            var L = skeleton.layout;
+            var layout = Object.assign({}, L, {
+                xaxis: Object.assign({}, L.xaxis),
+                yaxis: Object.assign({}, L.yaxis),
+                legend: Object.assign({}, L.legend)
+            });
+            if (!data || !data.historical) {
+                layout.title = {text: symbol + ' - Waiting for data...'};
+                return {data: [], layout: layout};
+            }
+            // Columnar store: historical = {ts: [...], price: [...]}, passed to Plotly as-is
+            var x = data.historical.ts;
+            var y = data.historical.price;
+            if (!x.length) {
+                layout.title = {text: symbol + ' - No historical data'};
+                return {data: [], layout: layout};
+            }
+
+            var T = skeleton.data;
+            var traces = [
+                Object.assign({}, T[0], {x: x, y: y, name: symbol + ' (Historical)'}),
+                Object.assign({}, T[1], {x: x, y: data.ma7}),
+                Object.assign({}, T[2], {x: x, y: data.ma30})
+            ];
+
+            var titleSuffix = '';
+            if (data.latest) {
+                traces.push(Object.assign({}, T[3], {
+                    x: [data.latest.ts], y: [data.latest.price],
+                    text: [data.latest.price.toFixed(6)]
+                }));
+                titleSuffix = ' + 最新点';
+            }
+
+            layout.title = {text: symbol + ' - 5分钟K线趋势 (' + x.length + ' 点) + MA7/MA30' + titleSuffix};
+            return {data: traces, layout: layout};
+        }
+    }
+});
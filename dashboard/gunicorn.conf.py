@@ -0,0 +1,15 @@
+# Gunicorn settings for the dashboard (Linux/production):
+#   gunicorn -c dashboard/gunicorn.conf.py app:server
+import os
+
+chdir = os.path.dirname(os.path.abspath(__file__))  # so app.py can import api_client
+bind = f"{os.getenv('DASHBOARD_HOST', '0.0.0.0')}:{os.getenv('DASHBOARD_PORT', '8050')}"
+
+# One process with a thread pool: MA state, the summary cache and pending AI jobs live
+# in memory, and the ai-poll callback has to reach the worker running the job.
+# Slow work (DeepSeek, Flask API calls) already runs off the request threads, so
+# threads are enough; gevent monkey-patching would fight the app's own asyncio loop.
+workers = 1
+worker_class = "gthread"
+threads = 16
+timeout = 60
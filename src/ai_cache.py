@@ -0,0 +1,63 @@
+import os
+import time
+import sqlite3
+import hashlib
+from typing import Optional, Tuple
+
+BASE_DIR = os.path.dirname(__file__)
+CACHE_DB = os.path.join(BASE_DIR, "..", "data", "ai_cache.db")
+
+# rows older than this are pruned on write (the TTL itself is enforced on read)
+MAX_AGE_SEC = 86400
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(CACHE_DB), exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, summary TEXT, created REAL)"
+    )
+    return conn
+
+
+def make_key(symbol: str, model: str, current_price: float, ma7, ma30, bucket: int) -> str:
+    """Deterministic key for a summary request.
+
+    Prices and MAs are rounded to 4 decimals so near-identical market states
+    within the same time bucket share one cached summary.
+    """
+    raw = f"{symbol}|{model}|{round(current_price, 4)}|{round(ma7 or 0, 4)}|{round(ma30 or 0, 4)}|{bucket}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def get(key: str, ttl_sec: int) -> Optional[Tuple[str, float]]:
+    """Return (summary, created_ts) if cached within ttl_sec, else None."""
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                "SELECT summary, created FROM summaries WHERE key = ? AND created >= ?",
+                (key, time.time() - ttl_sec),
+            ).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    return (row[0], row[1]) if row else None
+
+
+def put(key: str, summary: str) -> None:
+    now = time.time()
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO summaries (key, summary, created) VALUES (?, ?, ?)",
+                    (key, summary, now),
+                )
+                conn.execute("DELETE FROM summaries WHERE created < ?", (now - MAX_AGE_SEC,))
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        pass
@@ -8,10 +8,15 @@ Reads 7-day data from database and returns English market summary.
 import os
 import sys
 import sqlite3
+import time
 import requests
-from datetime import datetime, timedelta
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 from dotenv import load_dotenv
 
+import ai_cache
+
 # Load environment variables from .env file
 env_path = os.path.join(os.path.dirname(__file__), "..", ".env")
 load_dotenv(env_path)
@@ -24,8 +29,39 @@ DEEPSEEK_API_URL = "https://api.deepseek.com/chat/completions"
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 
+AI_MODEL = "gpt-3.5-turbo"
+
+# Summaries are reused within one 5-minute candle for the same symbol and price
+SUMMARY_CACHE_TTL_SEC = 300
+
 # Database configuration
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "market.db")
+# Read-only URI: a missing database fails with sqlite3.OperationalError instead of being created empty
+DB_URI = Path(os.path.abspath(DB_PATH)).as_uri() + "?mode=ro"
+
+# One read-only connection shared by every query in the process (e.g. the
+# per-symbol loop in __main__), opened on first use
+_read_conn = None
+
+
+def _connect_ro() -> sqlite3.Connection:
+    """Return the shared read-only connection, opening it on first use."""
+    global _read_conn
+    if _read_conn is None:
+        conn = sqlite3.connect(DB_URI, uri=True)
+        # Read-only analytics: memory-map the file and keep a large page cache so
+        # repeated per-symbol scans hit memory instead of re-reading pages
+        conn.execute("PRAGMA query_only=1")
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute("PRAGMA cache_size=-65536")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        _read_conn = conn
+    return _read_conn
+
+
+def _seven_days_ago() -> str:
+    """Naive-UTC ISO cutoff for the 7-day window (same string format as stored timestamps)."""
+    return (datetime.now(timezone.utc) - timedelta(days=7)).replace(tzinfo=None).isoformat()
 
 
 def get_7day_data_from_db(symbol: str) -> list:
@@ -38,17 +74,11 @@ def get_7day_data_from_db(symbol: str) -> list:
     Returns:
         List of dicts with 'timestamp', 'symbol', 'price' keys
     """
-    if not os.path.exists(DB_PATH):
-        print(f"Database not found: {DB_PATH}")
-        return []
-    
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        cursor = _connect_ro().cursor()
         
         # Calculate 7 days ago timestamp
-        seven_days_ago = (datetime.utcnow() - timedelta(days=7)).isoformat()
+        seven_days_ago = _seven_days_ago()
         
         # Query: Get all prices for symbol from last 7 days
         query = """
@@ -60,16 +90,15 @@ def get_7day_data_from_db(symbol: str) -> list:
         
         cursor.execute(query, (symbol, seven_days_ago))
         rows = cursor.fetchall()
-        conn.close()
         
-        # Convert to list of dicts
+        # Convert to list of dicts (price is a REAL column, so sqlite3 already returns floats)
         data = [
             {
-                'timestamp': row['timestamp'],
-                'symbol': row['symbol'],
-                'price': float(row['price'])
+                'timestamp': timestamp,
+                'symbol': row_symbol,
+                'price': price
             }
-            for row in rows
+            for timestamp, row_symbol, price in rows
         ]
         
         print(f"✓ Retrieved {len(data)} data points for {symbol} from last 7 days")
@@ -80,29 +109,77 @@ def get_7day_data_from_db(symbol: str) -> list:
         return []
 
 
+def get_7day_stats_from_db(symbol: str) -> dict:
+    """
+    Compute 7-day price statistics for symbol inside SQLite.
+    
+    One aggregate query over idx_prices_symbol_ts_price instead of loading every row
+    into Python and reducing it there.
+    
+    Args:
+        symbol: Trading symbol (e.g., 'GBPUSD=X')
+    
+    Returns:
+        Same keys as calculate_statistics(), or {} if there is no data
+    """
+    seven_days_ago = _seven_days_ago()
+    query = """
+    SELECT MIN(price), MAX(price), COUNT(*),
+           (SELECT price FROM prices WHERE symbol = ? AND timestamp >= ? ORDER BY timestamp ASC LIMIT 1),
+           (SELECT price FROM prices WHERE symbol = ? AND timestamp >= ? ORDER BY timestamp DESC LIMIT 1)
+    FROM prices
+    WHERE symbol = ? AND timestamp >= ?
+    """
+    
+    try:
+        min_price, max_price, count, first, last = _connect_ro().execute(
+            query, (symbol, seven_days_ago) * 3
+        ).fetchone()
+    except Exception as e:
+        print(f"❌ Database error: {e}")
+        return {}
+    
+    if not count:
+        return {}
+    
+    price_change = last - first
+    print(f"✓ Aggregated {count} data points for {symbol} from last 7 days")
+    return {
+        'current_price': float(last),
+        'previous_price': float(first),
+        'min_price': float(min_price),
+        'max_price': float(max_price),
+        'price_change': float(price_change),
+        'change_pct': (price_change / first * 100) if first != 0 else 0,
+        'data_points': count
+    }
+
+
 def calculate_statistics(prices: list) -> dict:
     """
     Calculate price statistics from 7-day data.
     
     Args:
-        prices: List of price values
+        prices: List (or array) of price values
     
     Returns:
         Dict with statistics
     """
-    if not prices or len(prices) < 2:
+    if prices is None or len(prices) < 2:
         return {}
     
-    current = prices[-1]
-    previous = prices[0]
+    # One conversion, then C-level min/max reductions instead of Python loops
+    arr = np.asarray(prices, dtype=np.float64)
+    current = float(arr[-1])
+    previous = float(arr[0])
     price_change = current - previous
     change_pct = (price_change / previous * 100) if previous != 0 else 0
     
     return {
         'current_price': current,
         'previous_price': previous,
-        'min_price': min(prices),
-        'max_price': max(prices),
+        'min_price': float(arr.min()),
+        'max_price': float(arr.max()),
         'price_change': price_change,
         'change_pct': change_pct,
         'data_points': len(prices)
@@ -162,7 +239,7 @@ def call_deepseek_api(prompt: str) -> str:
     
     try:
         response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+            model=AI_MODEL,
             messages=[
                 {
                     "role": "system",
@@ -202,26 +279,37 @@ def generate_ai_summary(symbol: str) -> dict:
     print(f"\n📊 Starting AI Summary generation for {symbol}...")
     print("=" * 60)
     
-    # Step 1: Read 7-day data from database
-    print("Step 1️⃣ : Reading 7-day data from database...")
-    data = get_7day_data_from_db(symbol)
+    # Step 1 + 2: 7-day statistics, aggregated in the database
+    print("Step 1️⃣ : Aggregating 7-day data in database...")
+    stats = get_7day_stats_from_db(symbol)
+    data_points = stats.get('data_points', 0)
     
-    if not data or len(data) < 2:
+    if data_points < 2:
         return {
             'success': False,
-            'summary': f'⚠️ Insufficient data: {len(data)} points (need at least 2)',
+            'summary': f'⚠️ Insufficient data: {data_points} points (need at least 2)',
             'stats': {},
             'timestamp': datetime.utcnow().isoformat()
         }
     
-    # Step 2: Calculate statistics
-    print("Step 2️⃣ : Calculating price statistics...")
-    prices = [d['price'] for d in data]
-    stats = calculate_statistics(prices)
+    print("Step 2️⃣ : Price statistics:")
     print(f"   Current: ${stats['current_price']:.6f}")
     print(f"   Range: ${stats['min_price']:.6f} - ${stats['max_price']:.6f}")
     print(f"   Change: {stats['change_pct']:+.2f}%")
     
+    # Cached summary for this symbol / price within the current 5-minute bucket (data/ai_cache.db)
+    bucket = int(time.time() // SUMMARY_CACHE_TTL_SEC)
+    cache_key = ai_cache.make_key(symbol, AI_MODEL, stats['current_price'], None, None, bucket)
+    cached = ai_cache.get(cache_key, SUMMARY_CACHE_TTL_SEC)
+    if cached:
+        print("✓ Using cached summary (same 5-minute window)")
+        return {
+            'success': True,
+            'summary': cached[0],
+            'stats': stats,
+            'timestamp': datetime.utcfromtimestamp(cached[1]).isoformat()
+        }
+    
     # Step 3: Generate prompt
     print("Step 3️⃣ : Generating analysis prompt...")
     prompt = generate_gpt_prompt(symbol, stats)
@@ -230,6 +318,8 @@ def generate_ai_summary(symbol: str) -> dict:
     # Step 4: Call DeepSeek API
     print("Step 4️⃣ : Calling DeepSeek API...")
     summary = call_deepseek_api(prompt)
+    if not summary.startswith('❌'):
+        ai_cache.put(cache_key, summary)
     
     # Step 5: Return result
     result = {
@@ -1,11 +1,29 @@
 import os
 import json
+import atexit
+import threading
 from datetime import datetime, timedelta, timezone
 from typing import Tuple, Dict
 
+try:
+    import orjson  # optional: faster (de)serialization of the usage file
+except ImportError:
+    orjson = None
+
 BASE_DIR = os.path.dirname(__file__)
 USAGE_FILE = os.path.join(BASE_DIR, "..", "data", "ai_usage.json")
 
+# Usage is read from USAGE_FILE once per process and then kept in memory;
+# changes are written back FLUSH_DELAY_SEC later (and at exit), so checks and
+# records do no file I/O on the request path. Each flush merges with the file
+# first, so processes sharing it (dashboard workers, ai_summary.py) keep one
+# combined count instead of overwriting each other's calls.
+FLUSH_DELAY_SEC = 5.0
+_usage = None
+_pending = 0  # calls recorded in this process since the last flush
+_lock = threading.Lock()
+_flush_timer = None
+
 
 def _ensure_dir():
     os.makedirs(os.path.dirname(USAGE_FILE), exist_ok=True)
@@ -20,8 +38,12 @@ def load_usage() -> Dict:
     if not os.path.exists(USAGE_FILE):
         return {"date": _today_str(), "count": 0, "last_ts": None}
     try:
-        with open(USAGE_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        if orjson is not None:
+            with open(USAGE_FILE, "rb") as f:
+                data = orjson.loads(f.read())
+        else:
+            with open(USAGE_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
         # basic shape guard
         if not isinstance(data, dict):
             return {"date": _today_str(), "count": 0, "last_ts": None}
@@ -31,23 +53,99 @@ def load_usage() -> Dict:
 
 
 def save_usage(data: Dict) -> None:
+    """Atomically replace USAGE_FILE (a crash never leaves a truncated file)."""
     _ensure_dir()
-    with open(USAGE_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False)
+    tmp = f"{USAGE_FILE}.{os.getpid()}.tmp"
+    if orjson is not None:
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(data))
+    else:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, USAGE_FILE)
+
+
+def _parse_ts(ts):
+    """Stored last_ts as an aware UTC datetime, or None if missing/unparsable."""
+    if not ts:
+        return None
+    try:
+        dt = datetime.fromisoformat(ts)
+    except (TypeError, ValueError):
+        return None
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+def _merge(usage: Dict, disk: Dict, pending: int) -> Dict:
+    """Combine this process's usage with what other processes have written to disk."""
+    date, disk_date = usage.get("date") or "", str(disk.get("date") or "")
+    if disk_date > date:
+        # another process already moved the file on to a later day
+        return dict(disk)
+    if disk_date != date:
+        return usage
+    try:
+        disk_count = int(disk.get("count", 0))
+    except (TypeError, ValueError):
+        disk_count = 0
+    # the file already holds every other process's calls; add ours on top of it
+    count = max(int(usage.get("count", 0)), disk_count + pending)
+    last_ts = usage.get("last_ts")
+    disk_dt = _parse_ts(disk.get("last_ts"))
+    if disk_dt is not None and (_parse_ts(last_ts) is None or disk_dt > _parse_ts(last_ts)):
+        last_ts = disk.get("last_ts")
+    return {"date": date, "count": count, "last_ts": last_ts}
 
 
-def can_call(max_calls_per_day: int = 20, cooldown_sec: int = 300) -> Tuple[bool, str, int]:
-    """Return (allowed, reason, wait_seconds). reason in {"ok","daily_cap","cooldown"}.
-    wait_seconds > 0 when not allowed.
+def _current() -> Dict:
+    """Today's in-memory usage, loaded on first use. Caller holds _lock."""
+    global _usage, _pending
+    if _usage is None:
+        _usage = load_usage()
+    # reset if new day
+    if _usage.get("date") != _today_str():
+        _usage = {"date": _today_str(), "count": 0, "last_ts": None}
+        _pending = 0
+        _schedule_flush()
+    return _usage
+
+
+def _schedule_flush() -> None:
+    """Persist _usage shortly; changes before the write share it. Caller holds _lock."""
+    global _flush_timer
+    if _flush_timer is None:
+        _flush_timer = threading.Timer(FLUSH_DELAY_SEC, flush)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+def flush() -> None:
+    """Merge pending in-memory usage into USAGE_FILE (no-op when nothing changed).
+
+    The file is re-read under the lock: for the same day the larger count and the
+    later last_ts win, and the merged result also becomes this process's view.
     """
-    now = datetime.now(timezone.utc)
-    usage = load_usage()
+    global _flush_timer, _usage, _pending
+    with _lock:
+        if _flush_timer is None:
+            return
+        _flush_timer.cancel()
+        _flush_timer = None
+        merged = _merge(_usage, load_usage(), _pending)
+        try:
+            save_usage(merged)
+        except Exception:
+            # keep the pending calls (and retry later) so a failed write cannot undercount
+            _schedule_flush()
+            raise
+        _usage = merged
+        _pending = 0
+
+
+atexit.register(flush)
 
-    # reset if new day
-    if usage.get("date") != _today_str():
-        usage = {"date": _today_str(), "count": 0, "last_ts": None}
-        save_usage(usage)
 
+def _check(usage: Dict, now: datetime, max_calls_per_day: int, cooldown_sec: int) -> Tuple[bool, str, int]:
     # daily cap
     if usage.get("count", 0) >= max_calls_per_day:
         # seconds until next UTC day
@@ -57,26 +155,46 @@ def can_call(max_calls_per_day: int = 20, cooldown_sec: int = 300) -> Tuple[bool
         return False, "daily_cap", max(wait, 0)
 
     # cooldown
-    last_ts = usage.get("last_ts")
-    if last_ts:
-        try:
-            last_dt = datetime.fromisoformat(last_ts)
-            if last_dt.tzinfo is None:
-                last_dt = last_dt.replace(tzinfo=timezone.utc)
-            elapsed = (now - last_dt).total_seconds()
-            if elapsed < cooldown_sec:
-                return False, "cooldown", int(cooldown_sec - elapsed)
-        except Exception:
-            pass
+    last_dt = _parse_ts(usage.get("last_ts"))
+    if last_dt is not None:
+        elapsed = (now - last_dt).total_seconds()
+        if elapsed < cooldown_sec:
+            return False, "cooldown", int(cooldown_sec - elapsed)
 
     return True, "ok", 0
 
 
-def record_call() -> None:
-    now = datetime.now(timezone.utc)
-    usage = load_usage()
-    if usage.get("date") != _today_str():
-        usage = {"date": _today_str(), "count": 0, "last_ts": None}
+def _record(usage: Dict, now: datetime) -> None:
+    global _pending
     usage["count"] = int(usage.get("count", 0)) + 1
+    _pending += 1
     usage["last_ts"] = now.isoformat()
-    save_usage(usage)
+    _schedule_flush()
+
+
+def can_call(max_calls_per_day: int = 20, cooldown_sec: int = 300) -> Tuple[bool, str, int]:
+    """Return (allowed, reason, wait_seconds). reason in {"ok","daily_cap","cooldown"}.
+    wait_seconds > 0 when not allowed.
+    """
+    now = datetime.now(timezone.utc)
+    with _lock:
+        return _check(_current(), now, max_calls_per_day, cooldown_sec)
+
+
+def record_call() -> None:
+    now = datetime.now(timezone.utc)
+    with _lock:
+        _record(_current(), now)
+
+
+def try_acquire(max_calls_per_day: int = 20, cooldown_sec: int = 300) -> Tuple[bool, str, int]:
+    """can_call + record_call as one atomic step: when allowed, the call is recorded
+    before returning, so concurrent callers cannot both pass the same check.
+    """
+    now = datetime.now(timezone.utc)
+    with _lock:
+        usage = _current()
+        result = _check(usage, now, max_calls_per_day, cooldown_sec)
+        if result[0]:
+            _record(usage, now)
+        return result
@@ -1,6 +1,22 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
+from functools import lru_cache
+from queue import Queue, Empty, Full
 import sqlite3
+import threading
+import json
+import time
 import os
+from pathlib import Path
+
+try:
+    import msgpack  # 可选：/history 的二进制响应格式
+except ImportError:
+    msgpack = None
+
+MSGPACK_MIMETYPE = "application/msgpack"
+
+# K 线周期（/history、/snapshot 的 interval 参数）→ 秒
+INTERVAL_SECONDS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600}
 
 app = Flask(__name__)
 
@@ -18,6 +34,55 @@ DB_PATH = os.path.abspath(DB_PATH)
 
 print(">>> DB PATH =", DB_PATH)    # 调试用：看到 Flask 真的会找这个文件
 
+# 所有请求共享一个只读连接（数据库为 WAL 模式，读不阻塞写入），
+# 避免每个请求 connect/close；同一条 SQL 由 sqlite3 的语句缓存复用
+_db_conn = None
+_db_lock = threading.Lock()
+
+
+def _tune_reader(conn):
+    # 只读分析负载：禁止写入；mmap 直接映射数据库页，大页缓存避免重复读盘；
+    # /history 等 ORDER BY/GROUP BY 的临时 B 树放在内存
+    conn.execute("PRAGMA query_only=1")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+def _query(sql, params=()):
+    """Run a read-only query on the shared connection and return all rows."""
+    global _db_conn
+    with _db_lock:
+        if _db_conn is None:
+            _db_conn = sqlite3.connect(Path(DB_PATH).as_uri() + "?mode=ro", uri=True,
+                                       check_same_thread=False)
+            _tune_reader(_db_conn)
+        # fetchall() runs each statement to completion, so no read transaction stays open
+        return _db_conn.execute(sql, params).fetchall()
+
+# /price 的进程内缓存：行情每分钟才写入一次，TTL 内的突发请求只查一次库
+# （TTL 可用环境变量 PRICE_CACHE_TTL 配置，单位秒）
+PRICE_CACHE_TTL_SEC = float(os.environ.get("PRICE_CACHE_TTL", "2"))
+_price_cache = {}  # symbol -> (time.monotonic(), (timestamp, price))
+
+
+def _latest_price_row(symbol):
+    """Newest (timestamp, price) row for symbol, served from _price_cache within the TTL."""
+    now = time.monotonic()
+    hit = _price_cache.get(symbol)
+    if hit and now - hit[0] < PRICE_CACHE_TTL_SEC:
+        return hit[1]
+    rows = _query(
+        "SELECT timestamp, price FROM prices WHERE symbol=? ORDER BY timestamp DESC LIMIT 1",
+        (symbol,)
+    )
+    row = rows[0] if rows else None
+    # 只缓存有数据的交易对：任意 ?symbol= 的未命中不会让缓存无限增长
+    if row is not None:
+        _price_cache[symbol] = (now, row)
+    return row
+
+
 # ---------------------
 # 3. API 路由
 # ---------------------
@@ -36,17 +101,8 @@ def get_price():
     # 直接使用原始符号（数据库中存储的是 GBPUSD, EURUSD, BTCUSD）
     db_symbol = symbol
     
-    # 连接数据库
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # 查询最新的价格记录
-    c.execute(
-        "SELECT timestamp, price FROM prices WHERE symbol=? ORDER BY timestamp DESC LIMIT 1",
-        (db_symbol,)
-    )
-    row = c.fetchone()
-    conn.close()
+    # 查询最新的价格记录（带短 TTL 缓存）
+    row = _latest_price_row(db_symbol)
 
     # 数据存在 → 返回 JSON
     if row:
@@ -63,9 +119,45 @@ def get_price():
 # ---------------------
 # 4. 启动 Flask
 # ---------------------
+def _parse_interval():
+    """Return (interval, seconds) from ?interval=, (None, None) for raw ticks, or None if unsupported."""
+    interval = request.args.get("interval")
+    if not interval:
+        return None, None
+    interval = interval.strip().lower()
+    if interval not in INTERVAL_SECONDS:
+        return None
+    return interval, INTERVAL_SECONDS[interval]
+
+
+def _rows_query(where_clause, interval_sec, limit=False):
+    """Chronological query for raw ticks, or for one close per candle when interval_sec is set.
+
+    Candles bucket on floor(epoch / interval) and keep the last tick of each bucket
+    (with its original timestamp string). SQLite takes the bare column price from the
+    row holding MAX(timestamp), so no window function is needed.
+
+    With limit, the newest `LIMIT ?` rows are picked newest-first over the index and
+    re-sorted ascending by SQLite, so callers never reverse rows in Python.
+    """
+    # 有 limit 时内层按时间倒序取最新的 LIMIT 行，外层再按时间正序排列
+    order = "ORDER BY timestamp DESC LIMIT ?" if limit else "ORDER BY timestamp ASC"
+    if interval_sec is None:
+        inner = f"SELECT timestamp, price FROM prices WHERE {where_clause} {order}"
+    else:
+        inner = (
+            f"SELECT MAX(timestamp) AS timestamp, price FROM prices WHERE {where_clause} "
+            f"GROUP BY CAST(strftime('%s', timestamp) AS INTEGER) / {int(interval_sec)} "
+            f"{order}"
+        )
+    if not limit:
+        return inner
+    return f"SELECT timestamp, price FROM ({inner}) ORDER BY timestamp ASC"
+
+
 @app.get("/history")
 def get_history():
-    # 返回历史价格点，参数：symbol, limit
+    # 返回历史价格点，参数：symbol, limit, start, end, interval（如 5m：服务端聚合为 K 线收盘价）
     symbol = request.args.get("symbol", "GBPUSD")
     symbol = symbol.strip()
     # support optional start/end ISO timestamps (inclusive)
@@ -76,13 +168,14 @@ def get_history():
         limit = int(limit) if limit is not None else None
     except Exception:
         limit = None
+    parsed = _parse_interval()
+    if parsed is None:
+        return jsonify({"error": "Unsupported interval", "supported": list(INTERVAL_SECONDS)}), 400
+    interval, interval_sec = parsed
 
     # 直接使用原始符号（数据库中存储的是 GBPUSD, EURUSD, BTCUSD）
     db_symbol = symbol
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
     params = [db_symbol]
     where_clause = "symbol=?"
 
@@ -96,21 +189,180 @@ def get_history():
         where_clause += " AND timestamp <= ?"
         params.append(end)
 
-    # build query
-    query = f"SELECT timestamp, price FROM prices WHERE {where_clause} ORDER BY timestamp DESC"
+    # build query (rows come back in chronological order)
+    query = _rows_query(where_clause, interval_sec, limit=bool(limit))
     if limit:
-        query += " LIMIT ?"
         params.append(limit)
 
-    c.execute(query, tuple(params))
-    rows = c.fetchall()
-    conn.close()
-
-    # rows are newest-first; reverse to chronological order
-    rows = list(reversed(rows))
+    rows = _query(query, tuple(params))
 
     data = [{"timestamp": r[0], "price": r[1]} for r in rows]
-    return jsonify({"symbol": symbol, "data": data})
+    payload = {"symbol": symbol, "data": data}
+    if interval:
+        payload["interval"] = interval
+    return _encode(payload)
+
+
+def _encode(payload):
+    # 客户端在 Accept 中优先要求 msgpack 时返回二进制（体积约为 JSON 的一半），否则保持 JSON
+    if msgpack is not None and request.accept_mimetypes.best == MSGPACK_MIMETYPE:
+        return Response(msgpack.packb(payload, use_bin_type=True), mimetype=MSGPACK_MIMETYPE)
+    return jsonify(payload)
+
+
+@app.get("/snapshot")
+def get_snapshot():
+    # 一次请求返回历史 + 最新价（dashboard 刷新只需一个往返），参数：symbol, limit, interval
+    symbol = request.args.get("symbol", "GBPUSD").strip()
+    try:
+        limit = int(request.args.get("limit", 500))
+    except Exception:
+        limit = 500
+    parsed = _parse_interval()
+    if parsed is None:
+        return jsonify({"error": "Unsupported interval", "supported": list(INTERVAL_SECONDS)}), 400
+    interval, interval_sec = parsed
+
+    rows = _query(_rows_query("symbol=?", interval_sec, limit=True), (symbol, limit))
+
+    # 最新价就是最后一行（与 /price 的查询相同），无需再查一次；
+    # 聚合时最新一根 K 线的收盘价也正是最新一笔
+    latest = {"symbol": symbol, "timestamp": rows[-1][0], "price": rows[-1][1]} if rows else None
+    history = [{"timestamp": r[0], "price": r[1]} for r in rows]
+    payload = {"symbol": symbol, "history": history, "latest": latest}
+    if interval:
+        payload["interval"] = interval
+    return _encode(payload)
+
+# ---------------------
+# 5. 实时推送（Server-Sent Events）
+#    单个后台线程轮询最新价格，推送给所有订阅的连接，
+#    替代每个客户端每 5 秒一次的 /price 轮询
+# ---------------------
+STREAM_POLL_SEC = 1.0        # 后台线程检查新数据的间隔
+STREAM_HEARTBEAT_SEC = 15.0  # 无新数据时发送心跳，防止空闲连接被断开
+STREAM_QUEUE_MAX = 32        # 每个订阅者最多积压的推送数，满时丢弃最旧的
+DEFAULT_STREAM_SYMBOLS = ("GBPUSD", "EURUSD", "BTCUSD")
+
+_subscribers = set()  # {(Queue, frozenset(symbols))}
+_subscribers_lock = threading.Lock()
+_watcher_started = False
+
+
+_LATEST_POINTS_BATCH = 256
+
+
+@lru_cache(maxsize=None)
+def _latest_points_sql(n):
+    # 每个交易对一个 LIMIT 1 子查询（各自一次索引定位），UNION ALL 合并为一条语句；
+    # 不用 GROUP BY symbol + MAX(timestamp)，那样会扫描每个交易对的全部行
+    branch = "SELECT * FROM (SELECT symbol, timestamp, price FROM prices WHERE symbol=? ORDER BY timestamp DESC LIMIT 1)"
+    return " UNION ALL ".join([branch] * n)
+
+
+def _latest_points(symbols, conn=None):
+    """Return {symbol: newest price row as a dict} for symbols with data, in one query
+    (shared connection unless conn is given)."""
+    symbols = tuple(symbols)
+    points = {}
+    # SQLite 限制复合查询的子句数（默认 500），交易对过多时分批
+    for i in range(0, len(symbols), _LATEST_POINTS_BATCH):
+        batch = symbols[i:i + _LATEST_POINTS_BATCH]
+        sql = _latest_points_sql(len(batch))
+        rows = conn.execute(sql, batch).fetchall() if conn is not None else _query(sql, batch)
+        for symbol, ts, price in rows:
+            points[symbol] = {"symbol": symbol, "timestamp": ts, "price": price}
+    return points
+
+
+def _offer(q, point):
+    """Queue point for one subscriber; a stalled client's full queue drops its oldest point.
+
+    Only the newest tick per symbol matters, so nothing of value is lost. The watcher is
+    the only producer, so the retry loop ends after at most one eviction.
+    """
+    while True:
+        try:
+            q.put_nowait(point)
+            return
+        except Full:
+            try:
+                q.get_nowait()
+            except Empty:
+                pass
+
+
+def _watch_prices():
+    """Poll the database for new ticks and fan them out to subscriber queues."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    _tune_reader(conn)
+    last_seen = {}
+    while True:
+        with _subscribers_lock:
+            subscribers = list(_subscribers)
+        symbols = set().union(*(syms for _, syms in subscribers)) if subscribers else set()
+
+        try:
+            points = _latest_points(symbols, conn)
+        except sqlite3.Error as e:
+            print(">>> stream watcher error:", e)
+            points = {}
+        for symbol, point in points.items():
+            if last_seen.get(symbol) == point["timestamp"]:
+                continue
+            last_seen[symbol] = point["timestamp"]
+            for q, syms in subscribers:
+                if symbol in syms:
+                    _offer(q, point)
+
+        time.sleep(STREAM_POLL_SEC)
+
+
+def _ensure_watcher():
+    global _watcher_started
+    with _subscribers_lock:
+        if _watcher_started:
+            return
+        _watcher_started = True
+    threading.Thread(target=_watch_prices, name="price-watcher", daemon=True).start()
+
+
+@app.get("/stream")
+def stream():
+    # 参数 symbols: 逗号分隔，默认推送全部交易对
+    raw = request.args.get("symbols", "")
+    symbols = frozenset(s.strip() for s in raw.split(",") if s.strip()) or frozenset(DEFAULT_STREAM_SYMBOLS)
+
+    q = Queue(maxsize=STREAM_QUEUE_MAX)
+    with _subscribers_lock:
+        _subscribers.add((q, symbols))
+    _ensure_watcher()
+
+    def gen():
+        try:
+            # 连接建立时先推送当前最新价，客户端无需再单独请求 /price
+            initial = _latest_points(sorted(symbols))
+            for point in initial.values():
+                yield f"data: {json.dumps(point)}\n\n"
+
+            while True:
+                try:
+                    point = q.get(timeout=STREAM_HEARTBEAT_SEC)
+                except Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(point)}\n\n"
+        finally:
+            with _subscribers_lock:
+                _subscribers.discard((q, symbols))
+
+    resp = Response(stream_with_context(gen()), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    # Dashboard 运行在 8050 端口，浏览器跨域订阅
+    resp.headers["Access-Control-Allow-Origin"] = "*"
+    return resp
+
 
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
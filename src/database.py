@@ -1,11 +1,100 @@
-﻿import sqlite3
+﻿import atexit
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import chain, islice
 
 DB_PATH = "data/market.db"
 
+# Rows per multi-row INSERT: 3 parameters each, kept under the conservative
+# SQLITE_MAX_VARIABLE_NUMBER default of 999 used by older SQLite builds
+INSERT_CHUNK_ROWS = 999 // 3
+
+# Long-lived connection for the live write paths (insert_price, insert_prices on
+# DB_PATH), opened on first use
+_write_conn = None
+_write_path = None
+_write_lock = threading.Lock()
+
+
+def connect(path=None, **kwargs):
+    """
+    Open a connection tuned for the ingest/read workload.
+
+    The database runs in WAL mode (set once in init_db), so readers such as the
+    API never block on a writer's commit and synchronous=NORMAL is still safe:
+    commits skip the fsync, which only happens at checkpoints.
+    """
+    conn = sqlite3.connect(path or DB_PATH, **kwargs)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+    conn.execute("PRAGMA temp_store=MEMORY")  # sorter/temp b-trees (e.g. index builds) stay off disk
+    return conn
+
+
+def _writer():
+    """Return the shared write connection, reopening it if DB_PATH has changed.
+
+    Autocommit mode (isolation_level=None) so callers issue BEGIN/COMMIT explicitly;
+    shared across threads (ingest_loop inserts from worker threads), so callers must
+    hold _write_lock.
+    """
+    global _write_conn, _write_path
+    if _write_conn is None or _write_path != DB_PATH:
+        if _write_conn is not None:
+            _write_conn.close()
+        _write_conn = connect(isolation_level=None, check_same_thread=False)
+        _write_path = DB_PATH
+    return _write_conn
+
+
+@contextmanager
+def _transaction(path=None):
+    """One write transaction: the shared write connection for DB_PATH, else a short-lived one."""
+    if path is None or path == DB_PATH:
+        with _write_transaction() as conn:
+            yield conn
+        return
+    conn = connect(path)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def _write_transaction():
+    """BEGIN IMMEDIATE ... COMMIT on the shared write connection (ROLLBACK on error)."""
+    with _write_lock:
+        conn = _writer()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+@atexit.register
+def close_writer():
+    """Close the shared write connection (also run at interpreter exit)."""
+    global _write_conn
+    with _write_lock:
+        if _write_conn is not None:
+            _write_conn.close()
+            _write_conn = None
+
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect()
     c = conn.cursor()
 
+    # journal_mode is persistent, so enabling WAL here covers every later connection
+    c.execute("PRAGMA journal_mode=WAL")
+
     c.execute("""
         CREATE TABLE IF NOT EXISTS prices (
             timestamp TEXT,
@@ -14,19 +103,85 @@ def init_db():
         );
     """)
 
+    # Full 5-minute candles from the K-line generator (prices only gets the close).
+    # Clustered on (symbol, ts) so per-symbol time-range scans read contiguous pages.
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS ohlc_5m (
+            symbol TEXT,
+            ts TEXT,
+            o REAL,
+            h REAL,
+            l REAL,
+            c REAL,
+            PRIMARY KEY (symbol, ts)
+        ) WITHOUT ROWID;
+    """)
+
     conn.commit()
+    conn.close()
     
     # Create index for faster queries on symbol and timestamp
+    create_index()
+
+
+def create_index(path=None):
+    """Create idx_prices_symbol_ts_price (no-op if it already exists).
+
+    The index covers (symbol, timestamp, price), so every per-symbol time-range
+    read is answered from the index alone. It supersedes the older
+    (symbol, timestamp) idx_prices_symbol_ts, which is dropped once the new one exists.
+    """
+    conn = connect(path)
     try:
-        c.execute("""
-            CREATE INDEX IF NOT EXISTS idx_prices_symbol_ts 
-            ON prices(symbol, timestamp)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_prices_symbol_ts_price 
+            ON prices(symbol, timestamp, price)
         """)
+        conn.execute("DROP INDEX IF EXISTS idx_prices_symbol_ts")
         conn.commit()
     except Exception as e:
         print(f"Index creation skipped or already exists: {e}")
-    
-    conn.close()
+    finally:
+        conn.close()
+
+
+def drop_index(path=None):
+    """Drop the prices indexes, e.g. before a large one-shot load."""
+    conn = connect(path)
+    try:
+        conn.execute("DROP INDEX IF EXISTS idx_prices_symbol_ts_price")
+        conn.execute("DROP INDEX IF EXISTS idx_prices_symbol_ts")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# Accepted (low, high) price range per symbol: forex pairs 0.5 - 3.0, BTC 1000 - 1000000.
+# A fixed table for the known symbols; any other symbol is classified by substring
+# (same rules as before) through a bounded memo, so the table never grows.
+_FOREX_RANGE = (0.5, 3.0)
+_BTC_RANGE = (1000, 1000000)
+_ANY_RANGE = (0, float("inf"))
+_PRICE_RANGES = {
+    'GBPUSD': _FOREX_RANGE, 'GBPUSD=X': _FOREX_RANGE,
+    'EURUSD': _FOREX_RANGE, 'EURUSD=X': _FOREX_RANGE,
+    'BTCUSD': _BTC_RANGE, 'BTC-USD': _BTC_RANGE,
+}
+
+
+@lru_cache(maxsize=256)
+def _derived_range(symbol):
+    """Range for a symbol missing from _PRICE_RANGES, by substring."""
+    if 'GBPUSD' in symbol or 'EURUSD' in symbol:
+        return _FOREX_RANGE
+    if 'BTC' in symbol:
+        return _BTC_RANGE
+    return _ANY_RANGE
+
+
+def price_range(symbol):
+    """Return the (low, high) range is_valid_price accepts for symbol."""
+    return _PRICE_RANGES.get(symbol) or _derived_range(symbol)
 
 
 def is_valid_price(price, symbol):
@@ -53,16 +208,22 @@ def is_valid_price(price, symbol):
         return False
     
     # Symbol-specific validation
-    if 'GBPUSD' in symbol or 'EURUSD' in symbol:
-        # Forex pairs should be in reasonable range (0.5 - 3.0)
-        if price < 0.5 or price > 3.0:
-            return False
-    elif 'BTCUSD' in symbol or 'BTC' in symbol:
-        # BTC should be reasonable (1000 - 1000000)
-        if price < 1000 or price > 1000000:
-            return False
-    
-    return True
+    low, high = _PRICE_RANGES.get(symbol) or price_range(symbol)
+    return not (price < low or price > high)
+
+
+# SQL form of is_valid_price's rules (keep the two in sync); instr() is a
+# case-sensitive substring test like Python's `in`
+INVALID_PRICE_WHERE = """
+    price IS NULL
+    OR typeof(price) NOT IN ('integer', 'real')
+    OR price <= 0
+    OR ((instr(symbol, 'GBPUSD') > 0 OR instr(symbol, 'EURUSD') > 0)
+        AND (price < 0.5 OR price > 3.0))
+    OR (instr(symbol, 'GBPUSD') = 0 AND instr(symbol, 'EURUSD') = 0
+        AND instr(symbol, 'BTC') > 0
+        AND (price < 1000 OR price > 1000000))
+"""
 
 
 def insert_price(record):
@@ -75,48 +236,154 @@ def insert_price(record):
         print(f"⚠️  Filtered out invalid price: {record.get('price')} for {record.get('symbol')}")
         return False
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    with _write_transaction() as conn:
+        conn.execute("""
+            INSERT INTO prices (timestamp, symbol, price)
+            VALUES (?, ?, ?)
+        """, (record["timestamp"], record["symbol"], record["price"]))
+    return True
 
-    c.execute("""
-        INSERT INTO prices (timestamp, symbol, price)
-        VALUES (?, ?, ?)
-    """, (record["timestamp"], record["symbol"], record["price"]))
 
-    conn.commit()
-    conn.close()
-    return True
+def insert_prices(records, path=None):
+    """
+    Insert many price records in a single transaction.
+    Invalid prices are filtered the same way as insert_price.
+    Writes to DB_PATH go through the shared write connection; any other path
+    gets a short-lived connection.
+
+    Returns:
+        int: Number of rows inserted
+    """
+    rows = []
+    for record in records:
+        if not is_valid_price(record.get("price"), record.get("symbol", "")):
+            print(f"⚠️  Filtered out invalid price: {record.get('price')} for {record.get('symbol')}")
+            continue
+        rows.append((record["timestamp"], record["symbol"], record["price"]))
+    
+    if not rows:
+        return 0
+    
+    with _transaction(path) as conn:  # one BEGIN/COMMIT for the whole batch
+        _insert_rows(conn, rows)
+    return len(rows)
+
+
+def insert_candles(klines, path=None):
+    """
+    Store closed 5-minute K-lines: the full OHLC row in ohlc_5m and the close in
+    prices (which the API and dashboard read), both in one transaction.
+    Candles whose close fails is_valid_price are skipped and returned to the caller.
+
+    Args:
+        klines: List of (symbol, kline) tuples, kline = {'timestamp', 'open', 'high', 'low', 'close'}
+
+    Returns:
+        tuple: (stored, rejected) lists of (symbol, kline) tuples
+    """
+    valid = []
+    rejected = []
+    for symbol, kline in klines:
+        if is_valid_price(kline.get("close"), symbol):
+            valid.append((symbol, kline))
+        else:
+            rejected.append((symbol, kline))
+    
+    if not valid:
+        return valid, rejected
+    
+    with _transaction(path) as conn:
+        _insert_rows(conn, [(kline["timestamp"], symbol, kline["close"]) for symbol, kline in valid])
+        conn.executemany(
+            "INSERT OR REPLACE INTO ohlc_5m (symbol, ts, o, h, l, c) VALUES (?, ?, ?, ?, ?, ?)",
+            [(symbol, kline["timestamp"], kline["open"], kline["high"], kline["low"], kline["close"])
+             for symbol, kline in valid])
+    return valid, rejected
+
+
+def bulk_load(records, path=None):
+    """
+    Historical backfill: insert_prices with the index dropped during the load
+    and rebuilt once afterwards, instead of updating the B-tree row by row.
+
+    Only worth it when the batch is large compared to the table (the rebuild
+    covers every row); the live/incremental paths use insert_prices directly.
+
+    Returns:
+        int: Number of rows inserted
+    """
+    drop_index(path)
+    try:
+        return insert_prices(records, path)
+    finally:
+        create_index(path)
+
+
+def _insert_rows(conn, rows):
+    """
+    INSERT rows using multi-row VALUES statements of up to INSERT_CHUNK_ROWS rows,
+    so SQLite steps one statement per chunk instead of one per row.
+    """
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, INSERT_CHUNK_ROWS))
+        if not chunk:
+            break
+        conn.execute(_multi_insert_sql(len(chunk)), list(chain.from_iterable(chunk)))
+
+
+@lru_cache(maxsize=None)
+def _multi_insert_sql(n):
+    # Same string object per row count, so the connection's statement cache
+    # (keyed by SQL text) hands back the already-compiled statement
+    return "INSERT INTO prices (timestamp, symbol, price) VALUES " + ",".join(["(?, ?, ?)"] * n)
 
 
 def clear_all_prices():
     """Clear all price data from database."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect()
     c = conn.cursor()
     c.execute("DELETE FROM prices")
+    try:
+        c.execute("DELETE FROM ohlc_5m")
+    except sqlite3.OperationalError:
+        pass  # database created before ohlc_5m existed (init_db adds it)
     conn.commit()
     count = c.execute("SELECT COUNT(*) FROM prices").fetchone()[0]
     conn.close()
     print(f"✓ Cleared all price data. Remaining records: {count}")
 
 
-def remove_invalid_prices():
-    """Remove invalid/anomaly prices from database."""
+def count_by_symbol():
+    """
+    Count stored rows per symbol.
+
+    The GROUP BY is answered from idx_prices_symbol_ts_price (index-only scan,
+    no table reads), on a read-only memory-mapped connection.
+
+    Returns:
+        dict: {symbol: row_count}
+    """
     conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Get all records
-    c.execute("SELECT rowid, timestamp, symbol, price FROM prices")
-    rows = c.fetchall()
-    
-    removed_count = 0
-    for rowid, timestamp, symbol, price in rows:
-        if not is_valid_price(price, symbol):
-            c.execute("DELETE FROM prices WHERE rowid = ?", (rowid,))
-            removed_count += 1
-            print(f"Removed invalid: {symbol} @ {timestamp} = {price}")
-    
-    conn.commit()
-    conn.close()
+    try:
+        conn.execute("PRAGMA query_only=1")
+        conn.execute("PRAGMA mmap_size=268435456")
+        rows = conn.execute(
+            "SELECT symbol, COUNT(*) FROM prices GROUP BY symbol ORDER BY symbol"
+        ).fetchall()
+    finally:
+        conn.close()
+    return dict(rows)
+
+
+def remove_invalid_prices():
+    """Remove invalid/anomaly prices from database (one DELETE, no per-row Python work)."""
+    conn = connect()
+    try:
+        with conn:
+            removed_count = conn.execute(f"DELETE FROM prices WHERE {INVALID_PRICE_WHERE}").rowcount
+    finally:
+        conn.close()
     print(f"✓ Removed {removed_count} invalid price records")
 
 
@@ -130,6 +397,9 @@ if __name__ == "__main__":
         elif sys.argv[1] == "clean":
             print("Removing invalid prices...")
             remove_invalid_prices()
+        elif sys.argv[1] == "stats":
+            for symbol, count in count_by_symbol().items():
+                print(f"{symbol}: {count} records")
     else:
         init_db()
         print("数据库初始化完成！market.db 已创建。")
@@ -1,6 +1,9 @@
-import yfinance as yf
+import asyncio
 import random
 
+import aiohttp
+import yfinance as yf
+
 # Symbol mapping: internal symbol -> yfinance symbol
 SYMBOL_MAP = {
     'GBPUSD': 'GBPUSD=X',
@@ -8,6 +11,13 @@ SYMBOL_MAP = {
     'BTCUSD': 'BTC-USD'
 }
 
+# Supported internal symbols (the SYMBOL_MAP keys), shared by the collectors
+SYMBOLS = tuple(SYMBOL_MAP)
+
+# Yahoo chart API, used when the yfinance batch download misses symbols
+YAHOO_CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{}"
+YAHOO_TIMEOUT_SEC = 5
+
 # Base prices for simulation fallback
 BASE_PRICES = {
     'GBPUSD': 1.27,
@@ -39,7 +49,96 @@ def fetch_price(symbol="GBPUSD"):
     except Exception:
         pass
     
-    # Fallback: generate simulated price with random walk
+    return _simulated_price(symbol)
+
+
+def fetch_prices(symbols):
+    """
+    Fetch latest prices for several symbols with a single yfinance download.
+    
+    Args:
+        symbols: Internal symbols (GBPUSD, EURUSD, BTCUSD)
+    
+    Returns:
+        dict: {symbol: price}; symbols missing from the download are retried
+        concurrently via fetch_prices_async, then simulated
+    """
+    yf_symbols = {symbol: SYMBOL_MAP.get(symbol, symbol) for symbol in symbols}
+    prices = {}
+    
+    try:
+        # 一次请求下载全部品种（1分钟级别），按品种分组
+        data = yf.download(" ".join(yf_symbols.values()), period="1d", interval="1m",
+                           progress=False, threads=True, group_by="ticker")
+        
+        for symbol, yf_symbol in yf_symbols.items():
+            try:
+                # 多个品种时列为 (ticker, field)；单个品种时为普通列
+                frame = data[yf_symbol] if data.columns.nlevels > 1 else data
+                closes = frame["Close"].dropna()  # 交易时段不同的品种在对齐后的行上为 NaN
+            except KeyError:
+                continue
+            if not closes.empty:
+                prices[symbol] = float(closes.iloc[-1])
+    except Exception:
+        pass
+    
+    missing = [symbol for symbol in symbols if symbol not in prices]
+    if missing:
+        try:
+            fetched = asyncio.run(fetch_prices_async(missing))
+        except Exception:
+            fetched = {}
+        for symbol in missing:
+            price = fetched.get(symbol)
+            prices[symbol] = price if price is not None else _simulated_price(symbol)
+    return prices
+
+
+async def _fetch_one(session, symbol):
+    """Latest price for one symbol from the chart API's meta, or None on any failure."""
+    url = YAHOO_CHART_URL.format(SYMBOL_MAP.get(symbol, symbol))
+    try:
+        async with session.get(url, params={"range": "1d", "interval": "1m"},
+                               timeout=aiohttp.ClientTimeout(total=YAHOO_TIMEOUT_SEC)) as resp:
+            if resp.status != 200:
+                return symbol, None
+            body = await resp.json()
+        return symbol, float(body["chart"]["result"][0]["meta"]["regularMarketPrice"])
+    except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, IndexError, TypeError, ValueError):
+        return symbol, None
+
+
+def yahoo_session():
+    """aiohttp session for the chart API; long-running callers can keep one open."""
+    # Yahoo rejects requests without a browser-like User-Agent
+    return aiohttp.ClientSession(headers={"User-Agent": "Mozilla/5.0"})
+
+
+async def fetch_prices_async(symbols, session=None, fallback=False):
+    """
+    Fetch latest prices concurrently, one Yahoo chart request per symbol.
+    
+    Args:
+        symbols: Internal symbols
+        session: Optional session from yahoo_session(); a temporary one is used otherwise
+        fallback: Simulate prices for symbols the API could not price
+    
+    Returns:
+        dict: {symbol: price or None}; never None with fallback=True
+    """
+    if session is None:
+        async with yahoo_session() as session:
+            return await fetch_prices_async(symbols, session, fallback)
+    results = await asyncio.gather(*(_fetch_one(session, symbol) for symbol in symbols))
+    if fallback:
+        return {symbol: price if price is not None else _simulated_price(symbol)
+                for symbol, price in results}
+    return dict(results)
+
+
+def _simulated_price(symbol):
+    """Fallback: generate simulated price with random walk."""
     base = BASE_PRICES.get(symbol, 1.0)
     if symbol == 'BTCUSD':
         variation = random.uniform(-500, 500)
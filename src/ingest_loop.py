@@ -1,30 +1,52 @@
-import time
+import asyncio
 import signal
-import sys
-from ingest import ingest_once
 
-running = True
+from fetch_data import SYMBOLS, fetch_prices_async, yahoo_session
+from models import build_price_record
+from database import init_db, insert_prices
 
-def handle_sigint(signum, frame):
-    global running
-    running = False
-    print("Received stop signal, exiting...")
+INTERVAL_SEC = 60
 
-signal.signal(signal.SIGINT, handle_sigint)
-signal.signal(signal.SIGTERM, handle_sigint)
 
-if __name__ == "__main__":
-    symbol = "GBPUSD=X"
-    interval = 60  # seconds
-    print(f"Starting ingest loop for {symbol}, interval={interval}s")
-    while running:
+async def ingest_tick(session, symbols):
+    """Fetch all symbols concurrently and store one record per symbol in one transaction."""
+    prices = await fetch_prices_async(symbols, session, fallback=True)
+    records = [build_price_record(symbol, prices[symbol]) for symbol in symbols]
+    # sqlite is blocking; keep the event loop free for cancellation
+    inserted = await asyncio.to_thread(insert_prices, records)
+    print(f"Inserted {inserted}/{len(records)}:", records)
+
+
+async def main(symbols=SYMBOLS, interval=INTERVAL_SEC):
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    for sig in (signal.SIGINT, signal.SIGTERM):
         try:
-            ingest_once(symbol)
-        except Exception as e:
-            print("Ingest error:", e)
-        # sleep with small granularity to react to signals
-        for _ in range(int(interval)):
-            if not running:
-                break
-            time.sleep(1)
+            loop.add_signal_handler(sig, task.cancel)
+        except (NotImplementedError, AttributeError):
+            # Windows: no loop signal handlers (or no SIGTERM); asyncio.run still
+            # cancels main() on Ctrl+C
+            pass
+
+    init_db()
+    print(f"Starting ingest loop for {', '.join(symbols)}, interval={interval}s")
+    try:
+        async with yahoo_session() as session:
+            while True:
+                # fixed cadence: fetch time counts against the interval
+                deadline = loop.time() + interval
+                try:
+                    await ingest_tick(session, symbols)
+                except Exception as e:
+                    print("Ingest error:", e)
+                await asyncio.sleep(max(0.0, deadline - loop.time()))
+    except asyncio.CancelledError:
+        print("Received stop signal, exiting...")
     print("Ingest loop stopped")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
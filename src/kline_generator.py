@@ -5,27 +5,25 @@ Collects tick data and generates proper OHLC (Open, High, Low, Close) candlestic
 
 Workflow:
 1. Continuously fetch tick prices (every few seconds)
-2. Accumulate ticks within 5-minute intervals
-3. At interval end, generate OHLC from accumulated ticks
+2. Update the running OHLC of the current 5-minute interval on every tick
+3. At interval end, emit the OHLC and start a new one
 4. Validate and save to database
 """
 
 import time
-import sqlite3
 from datetime import datetime, timedelta
-from collections import defaultdict
 import signal
 import sys
 
 # Import existing modules
-from fetch_data import fetch_price
-from database import init_db, is_valid_price
+from fetch_data import SYMBOLS, fetch_prices
+from database import init_db, insert_candles, is_valid_price
 
 DB_PATH = "data/market.db"
 
 # Global state
 running = True
-tick_buffer = defaultdict(list)  # {symbol: [(timestamp, price), ...]}
+kline_state = {}  # {symbol: running OHLC of the open bucket}
 
 
 def signal_handler(sig, frame):
@@ -44,64 +42,53 @@ def get_5min_bucket(dt):
     return dt.replace(minute=minutes, second=0, microsecond=0)
 
 
-def generate_kline_from_ticks(ticks):
+def update_kline(symbol, timestamp, price):
     """
-    Generate OHLC candlestick from tick data.
+    Fold one tick into the symbol's open K-line in O(1).
+    Ticks arrive in time order, so the first tick is the open and the latest the close.
+    """
+    kline = kline_state.get(symbol)
+    if kline is None:
+        kline_state[symbol] = {
+            'open': price,
+            'high': price,
+            'low': price,
+            'close': price,
+            'timestamp': timestamp  # Use last tick's timestamp
+        }
+        return
+    if price > kline['high']:
+        kline['high'] = price
+    if price < kline['low']:
+        kline['low'] = price
+    kline['close'] = price
+    kline['timestamp'] = timestamp
+
+
+def insert_klines(klines):
+    """
+    Insert closed K-lines (candlesticks) into database in one transaction:
+    full OHLC into ohlc_5m, the close into prices.
     
     Args:
-        ticks: List of (timestamp, price) tuples
+        klines: List of (symbol, kline) tuples
     
     Returns:
-        dict with 'open', 'high', 'low', 'close', 'timestamp'
+        int: Number of K-lines saved
     """
-    if not ticks:
-        return None
-    
-    # Sort by timestamp
-    ticks.sort(key=lambda x: x[0])
+    saved, rejected = insert_candles(klines, DB_PATH)
     
-    prices = [p for _, p in ticks]
-    
-    return {
-        'open': prices[0],      # First tick
-        'high': max(prices),    # Highest tick
-        'low': min(prices),     # Lowest tick
-        'close': prices[-1],    # Last tick
-        'timestamp': ticks[-1][0]  # Use last tick's timestamp
-    }
-
-
-def insert_kline(symbol, kline):
-    """
-    Insert a K-line (candlestick) into database.
-    Stores as a single close price for now (can expand to OHLC table later).
-    """
-    # Validate the close price
-    if not is_valid_price(kline['close'], symbol):
+    for symbol, kline in rejected:
         print(f"⚠️  Invalid K-line close price: {kline['close']} for {symbol}")
-        return False
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    for symbol, kline in saved:
+        print(f"✓ K-line saved: {symbol} @ {kline['timestamp'][:19]} | "
+              f"O:{kline['open']:.6f} H:{kline['high']:.6f} "
+              f"L:{kline['low']:.6f} C:{kline['close']:.6f}")
     
-    # For now, store as regular price (close)
-    # TODO: Create separate OHLC table for full candlestick data
-    c.execute("""
-        INSERT INTO prices (timestamp, symbol, price)
-        VALUES (?, ?, ?)
-    """, (kline['timestamp'], symbol, kline['close']))
-    
-    conn.commit()
-    conn.close()
-    
-    print(f"✓ K-line saved: {symbol} @ {kline['timestamp'][:19]} | "
-          f"O:{kline['open']:.6f} H:{kline['high']:.6f} "
-          f"L:{kline['low']:.6f} C:{kline['close']:.6f}")
-    
-    return True
+    return len(saved)
 
 
-def collect_and_generate_klines(symbols=['GBPUSD', 'EURUSD', 'BTCUSD'], 
+def collect_and_generate_klines(symbols=SYMBOLS, 
                                   tick_interval=5, 
                                   kline_interval=300):
     """
@@ -112,7 +99,7 @@ def collect_and_generate_klines(symbols=['GBPUSD', 'EURUSD', 'BTCUSD'],
         tick_interval: Seconds between tick fetches (default 5)
         kline_interval: Seconds per K-line (default 300 = 5 minutes)
     """
-    global running, tick_buffer
+    global running
     
     init_db()
     print(f"\n🚀 Starting K-line generator...")
@@ -122,21 +109,21 @@ def collect_and_generate_klines(symbols=['GBPUSD', 'EURUSD', 'BTCUSD'],
     print(f"\nPress Ctrl+C to stop.\n")
     
     last_bucket = {}  # Track last processed bucket per symbol
+    next_deadline = time.monotonic()  # absolute tick schedule, so fetch/DB time does not add drift
     
     while running:
         now = datetime.utcnow()
         current_bucket = get_5min_bucket(now)
+        timestamp = now.isoformat()  # one timestamp for every symbol in this tick
         
-        # Fetch ticks for all symbols
-        for symbol in symbols:
+        # Fetch ticks for all symbols (one download for the whole batch)
+        prices = fetch_prices(symbols)
+        
+        for symbol, price in prices.items():
             try:
-                # Fetch current price (tick)
-                price = fetch_price(symbol)
-                
                 # Validate before adding to buffer
                 if is_valid_price(price, symbol):
-                    timestamp = now.isoformat()
-                    tick_buffer[symbol].append((timestamp, price))
+                    update_kline(symbol, timestamp, price)
                     print(f"📍 Tick: {symbol} = {price:.6f} @ {timestamp[:19]}")
                 else:
                     print(f"⚠️  Filtered invalid tick: {symbol} = {price}")
@@ -145,6 +132,7 @@ def collect_and_generate_klines(symbols=['GBPUSD', 'EURUSD', 'BTCUSD'],
                 print(f"❌ Error fetching {symbol}: {e}")
         
         # Check if we need to close K-lines for any symbol
+        closed = []
         for symbol in symbols:
             if symbol not in last_bucket:
                 last_bucket[symbol] = current_bucket
@@ -152,20 +140,25 @@ def collect_and_generate_klines(symbols=['GBPUSD', 'EURUSD', 'BTCUSD'],
             
             # If bucket has changed, generate K-line for previous bucket
             if current_bucket > last_bucket[symbol]:
-                ticks = tick_buffer[symbol]
-                
-                if ticks:
-                    kline = generate_kline_from_ticks(ticks)
-                    if kline:
-                        insert_kline(symbol, kline)
-                    
-                    # Clear buffer for this symbol
-                    tick_buffer[symbol] = []
+                # Emit the running K-line (if any ticks arrived) and start a fresh one
+                kline = kline_state.pop(symbol, None)
+                if kline:
+                    closed.append((symbol, kline))
                 
                 last_bucket[symbol] = current_bucket
         
-        # Wait before next tick
-        time.sleep(tick_interval)
+        # All symbols close on the same bucket boundary: write them together
+        if closed:
+            insert_klines(closed)
+        
+        # Wait until the next tick's deadline; after a stall longer than one
+        # interval, restart the schedule from now instead of firing a burst of ticks
+        next_deadline += tick_interval
+        sleep_for = next_deadline - time.monotonic()
+        if sleep_for > 0:
+            time.sleep(sleep_for)
+        else:
+            next_deadline = time.monotonic()
     
     print("\n✓ K-line generator stopped.")
 
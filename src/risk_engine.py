@@ -11,9 +11,90 @@ Risk Engine - 风险引擎
 5. 风险信号生成（Risk Signal Generation）
 """
 
+import math
+
 import numpy as np
 from datetime import datetime, timedelta
-from typing import List, Dict, Tuple, Optional
+from functools import cache
+from typing import List, Dict, Tuple, Optional, Sequence, Union
+
+# 价格序列：列表或 np.ndarray；float64 数组经 np.asarray 直接使用，不再复制
+PriceSeries = Union[Sequence[float], np.ndarray]
+
+
+_EPS = np.finfo(np.float64).eps
+
+
+def _rolling_mean_std(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    滚动均值与样本标准差（ddof=1），用前缀和 O(N) 计算，不逐窗口重算
+    
+    先减去整体均值再累加，降低平方和相减的精度损失；方差低于舍入误差量级的
+    窗口（价格不变）按 0 处理
+    
+    Returns:
+        (means, stds)，长度均为 len(values) - window + 1，第 k 项对应窗口 values[k:k+window]
+    """
+    return _rolling_kernel()(values, window, values.mean())
+
+
+def _cumsum_mean_std(values, window, offset):
+    centered = values - offset
+    csum = np.concatenate(([0.0], np.cumsum(centered)))
+    csum2 = np.concatenate(([0.0], np.cumsum(centered * centered)))
+    sums = csum[window:] - csum[:-window]
+    var = (csum2[window:] - csum2[:-window] - sums * sums / window) / (window - 1)
+    var[var <= 16 * _EPS * csum2[-1] / (window - 1)] = 0.0
+    return sums / window + offset, np.sqrt(var)
+
+
+def _prefix_mean_std(values, window, offset):
+    # 与 _cumsum_mean_std 相同的运算顺序（结果逐位一致），单次循环、无中间数组
+    n = len(values)
+    csum = np.empty(n + 1)
+    csum2 = np.empty(n + 1)
+    csum[0] = 0.0
+    csum2[0] = 0.0
+    s = 0.0
+    s2 = 0.0
+    for i in range(n):
+        c = values[i] - offset
+        s += c
+        s2 += c * c
+        csum[i + 1] = s
+        csum2[i + 1] = s2
+    tol = 16 * _EPS * s2 / (window - 1)
+    means = np.empty(n - window + 1)
+    stds = np.empty(n - window + 1)
+    for k in range(n - window + 1):
+        sm = csum[k + window] - csum[k]
+        var = (csum2[k + window] - csum2[k] - sm * sm / window) / (window - 1)
+        if var <= tol:
+            var = 0.0
+        means[k] = sm / window + offset
+        stds[k] = np.sqrt(var)
+    return means, stds
+
+
+@cache
+def _rolling_kernel():
+    """滚动统计内核：有 numba 时用编译后的单循环版本，否则用 NumPy 前缀和
+
+    numba 在首次使用时才导入，不影响模块导入速度
+    """
+    try:
+        from numba import njit
+    except ImportError:
+        return _cumsum_mean_std
+    return njit(cache=True, nogil=True)(_prefix_mean_std)
+
+
+def warm_up() -> None:
+    """预热滚动内核：导入 numba 并加载（或编译）内核，首次约 1 秒
+
+    长驻进程可在后台线程调用，首个风险报告不再承担这部分开销
+    """
+    _rolling_mean_std(np.linspace(1.0, 2.0, 64), 20)
 
 
 class RiskEngine:
@@ -24,7 +105,8 @@ class RiskEngine:
     def __init__(self, 
                  volatility_window: int = 20,
                  anomaly_threshold: float = 2.5,
-                 high_volatility_threshold: float = 0.02):
+                 high_volatility_threshold: float = 0.02,
+                 ewma_lambda: float = 0.94):
         """
         初始化风险引擎
         
@@ -32,17 +114,21 @@ class RiskEngine:
             volatility_window: 波动率计算窗口（默认20个周期）
             anomaly_threshold: 异常检测阈值（标准差倍数，默认2.5）
             high_volatility_threshold: 高波动率阈值（默认2%）
+            ewma_lambda: 流式 EWMA 波动率的衰减系数（默认0.94，RiskMetrics）
         """
         self.volatility_window = volatility_window
         self.anomaly_threshold = anomaly_threshold
         self.high_volatility_threshold = high_volatility_threshold
+        self.ewma_lambda = ewma_lambda
+        # {symbol: (上一价格, EWMA 方差或 None)}，供 update_tick 使用
+        self._ewma_state: Dict[str, Tuple[float, Optional[float]]] = {}
     
-    def calculate_returns(self, prices: List[float]) -> np.ndarray:
+    def calculate_returns(self, prices: PriceSeries) -> np.ndarray:
         """
         计算收益率序列
         
         Args:
-            prices: 价格列表
+            prices: 价格列表或 np.ndarray
             
         Returns:
             收益率数组
@@ -50,16 +136,16 @@ class RiskEngine:
         if len(prices) < 2:
             return np.array([])
         
-        prices_array = np.array(prices)
+        prices_array = np.asarray(prices, dtype=np.float64)
         returns = np.diff(prices_array) / prices_array[:-1]
         return returns
     
-    def calculate_rolling_std(self, prices: List[float], window: int = None) -> np.ndarray:
+    def calculate_rolling_std(self, prices: PriceSeries, window: int = None) -> np.ndarray:
         """
         计算滚动标准差
         
         Args:
-            prices: 价格列表
+            prices: 价格列表或 np.ndarray
             window: 滚动窗口大小（默认使用初始化时的窗口）
             
         Returns:
@@ -69,23 +155,20 @@ class RiskEngine:
             window = self.volatility_window
         
         if len(prices) < window:
-            return np.array([np.nan] * len(prices))
+            return np.full(len(prices), np.nan)
         
-        prices_array = np.array(prices)
+        prices_array = np.asarray(prices, dtype=np.float64)
         rolling_std = np.full(len(prices), np.nan)
-        
-        for i in range(window - 1, len(prices)):
-            window_data = prices_array[i - window + 1:i + 1]
-            rolling_std[i] = np.std(window_data, ddof=1)
+        rolling_std[window - 1:] = _rolling_mean_std(prices_array, window)[1]
         
         return rolling_std
     
-    def calculate_volatility(self, prices: List[float]) -> Dict[str, float]:
+    def calculate_volatility(self, prices: PriceSeries) -> Dict[str, float]:
         """
         计算波动率指标
         
         Args:
-            prices: 价格列表
+            prices: 价格列表或 np.ndarray
             
         Returns:
             波动率指标字典
@@ -110,14 +193,8 @@ class RiskEngine:
                 'is_high_volatility': current_vol > self.high_volatility_threshold
             }
         
-        # 滚动窗口波动率
-        rolling_vols = []
-        for i in range(self.volatility_window - 1, len(returns)):
-            window_returns = returns[i - self.volatility_window + 1:i + 1]
-            vol = np.std(window_returns, ddof=1)
-            rolling_vols.append(vol)
-        
-        rolling_vols = np.array(rolling_vols)
+        # 滚动窗口波动率（所有窗口一次向量化计算）
+        rolling_vols = _rolling_mean_std(returns, self.volatility_window)[1]
         current_vol = rolling_vols[-1]
         avg_vol = np.mean(rolling_vols)
         
@@ -131,12 +208,42 @@ class RiskEngine:
             'is_high_volatility': current_vol > self.high_volatility_threshold
         }
     
-    def detect_anomalies(self, prices: List[float]) -> Dict[str, any]:
+    def update_tick(self, symbol: str, price: float) -> Dict[str, float]:
+        """
+        流式波动率（RiskMetrics EWMA）：每个新价格 O(1) 更新，不需要历史数组
+        
+        var_t = λ·var_{t-1} + (1-λ)·r_t²，r_t 为对数收益率，第一个收益率的平方作为初始方差
+        
+        Args:
+            symbol: 交易品种
+            price: 最新价格（非正价格忽略）
+            
+        Returns:
+            {'current_volatility', 'is_high_volatility'}（收到第二个有效价格前波动率为 0）
+        """
+        state = self._ewma_state.get(symbol)
+        if price > 0:
+            if state is None:
+                state = (price, None)
+            else:
+                last_price, var = state
+                r = math.log(price / last_price)
+                var = r * r if var is None else self.ewma_lambda * var + (1 - self.ewma_lambda) * r * r
+                state = (price, var)
+            self._ewma_state[symbol] = state
+        
+        vol = math.sqrt(state[1]) if state and state[1] is not None else 0.0
+        return {
+            'current_volatility': vol,
+            'is_high_volatility': vol > self.high_volatility_threshold
+        }
+    
+    def detect_anomalies(self, prices: PriceSeries) -> Dict[str, any]:
         """
         异常检测（基于滚动标准差）
         
         Args:
-            prices: 价格列表
+            prices: 价格列表或 np.ndarray
             
         Returns:
             异常检测结果
@@ -162,26 +269,22 @@ class RiskEngine:
                 'latest_z_score': 0.0
             }
         
-        prices_array = np.array(prices)
-        anomalies = []
-        anomaly_indices = []
-        z_scores = []
+        prices_array = np.asarray(prices, dtype=np.float64)
         
-        # 计算滚动均值和标准差
-        for i in range(self.volatility_window - 1, len(prices)):
-            window_data = prices_array[i - self.volatility_window + 1:i + 1]
-            mean = np.mean(window_data)
-            std = np.std(window_data, ddof=1)
-            
-            # 保护：标准差为0或无效时跳过
-            if std > 0 and not np.isnan(std):
-                z_score = (prices_array[i] - mean) / std
-                z_scores.append(z_score)
-                
-                # 检测异常（超过阈值）
-                if abs(z_score) > self.anomaly_threshold:
-                    anomalies.append(prices_array[i])
-                    anomaly_indices.append(i)
+        # 计算滚动均值和标准差（每个窗口以其最后一个价格为检测对象）
+        means, stds = _rolling_mean_std(prices_array, self.volatility_window)
+        idx = np.arange(self.volatility_window - 1, len(prices_array))
+        
+        # 保护：标准差为0或无效时跳过
+        valid = (stds > 0) & ~np.isnan(stds)
+        idx = idx[valid]
+        z = (prices_array[idx] - means[valid]) / stds[valid]
+        
+        # 检测异常（超过阈值）
+        hit = np.abs(z) > self.anomaly_threshold
+        anomaly_indices = idx[hit].tolist()
+        anomalies = prices_array[idx[hit]].tolist()
+        z_scores = z.tolist()
         
         return {
             'has_anomaly': len(anomalies) > 0,
@@ -192,12 +295,12 @@ class RiskEngine:
             'latest_z_score': float(z_scores[-1]) if z_scores else 0.0
         }
     
-    def assess_risk_level(self, prices: List[float]) -> Dict[str, any]:
+    def assess_risk_level(self, prices: PriceSeries) -> Dict[str, any]:
         """
         评估风险等级
         
         Args:
-            prices: 价格列表
+            prices: 价格列表或 np.ndarray
             
         Returns:
             风险评估结果
@@ -256,12 +359,14 @@ class RiskEngine:
             'anomalies': anomalies
         }
     
-    def generate_risk_signals(self, prices: List[float]) -> List[Dict[str, any]]:
+    def generate_risk_signals(self, prices: PriceSeries,
+                              risk_assessment: Optional[Dict[str, any]] = None) -> List[Dict[str, any]]:
         """
         生成风险信号
         
         Args:
-            prices: 价格列表
+            prices: 价格列表或 np.ndarray
+            risk_assessment: 已计算的 assess_risk_level 结果（可选，避免重复计算）
             
         Returns:
             风险信号列表
@@ -272,7 +377,8 @@ class RiskEngine:
             return signals
         
         # 评估风险
-        risk_assessment = self.assess_risk_level(prices)
+        if risk_assessment is None:
+            risk_assessment = self.assess_risk_level(prices)
         volatility = risk_assessment['volatility']
         anomalies = risk_assessment['anomalies']
         
@@ -317,12 +423,12 @@ class RiskEngine:
         
         return signals
     
-    def get_risk_report(self, prices: List[float], timestamps: List[str] = None) -> Dict[str, any]:
+    def get_risk_report(self, prices: PriceSeries, timestamps: List[str] = None) -> Dict[str, any]:
         """
         生成完整的风险报告
         
         Args:
-            prices: 价格列表
+            prices: 价格列表或 np.ndarray（只转换一次，后续计算全部基于数组）
             timestamps: 时间戳列表（可选）
             
         Returns:
@@ -337,14 +443,16 @@ class RiskEngine:
                 'required_points': self.volatility_window
             }
         
+        prices = np.asarray(prices, dtype=np.float64)
+        
         # 风险评估
         risk_assessment = self.assess_risk_level(prices)
         
-        # 风险信号
-        signals = self.generate_risk_signals(prices)
+        # 风险信号（复用上面的评估结果）
+        signals = self.generate_risk_signals(prices, risk_assessment)
         
         # 统计信息
-        current_price = prices[-1]
+        current_price = float(prices[-1])
         price_change = ((prices[-1] - prices[0]) / prices[0] * 100) if prices[0] != 0 else 0
         
         report = {
@@ -371,7 +479,7 @@ class RiskEngine:
         return report
 
 
-def analyze_risk(prices: List[float], symbol: str = 'UNKNOWN') -> Dict[str, any]:
+def analyze_risk(prices: PriceSeries, symbol: str = 'UNKNOWN') -> Dict[str, any]:
     """
     便捷函数：分析价格序列的风险
     